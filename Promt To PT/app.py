@@ -2,17 +2,29 @@
 import streamlit as st
 import streamlit.components.v1 as components
 from rag_pipeline import ask_question
+import history
+import indexer
+import warmup
 import os
 import base64
+import uuid
 
 # Page config
 st.set_page_config(page_title="Healthcare RAG AI", layout="wide")
 
+
+# No-op when run_app.py already started warm-up with the server process
+warmup.start_in_background()
+
 # ==========================================
 # Session state initialization
 # ==========================================
+if "session_id" not in st.session_state:
+    # Kept in the URL so a reload or server restart restores the conversation
+    st.session_state.session_id = st.query_params.get("session") or uuid.uuid4().hex
+    st.query_params["session"] = st.session_state.session_id
 if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
+    st.session_state.chat_history = history.load_chat(st.session_state.session_id)
 if "submission_count" not in st.session_state:
     st.session_state.submission_count = 0
 if "sidebar_collapsed" not in st.session_state:
@@ -508,6 +520,9 @@ def render_sidebar():
         # Clear Chat History Button (Destructive)
         if st.button("🗑️ Clear Chat History", use_container_width=True, key="clear_chat_btn"):
             st.session_state.chat_history = []
+            # Start a new session; the old one stays in the query log
+            st.session_state.session_id = uuid.uuid4().hex
+            st.query_params["session"] = st.session_state.session_id
             st.rerun()
         
         # Export Chat Button
@@ -560,8 +575,22 @@ if st.session_state.current_page == "chat":
         elif item["type"] == "source":
             st.markdown(f"<div class='source-container'>📄 <strong>Source:</strong> {item['text']}</div>", unsafe_allow_html=True)
 
-    # Input form
+    # Search scope: limit retrieval to one document and/or a page range
     st.divider()
+    docs_dir = os.path.join(os.getcwd(), "docs")
+    scope_pdfs = sorted(f for f in os.listdir(docs_dir) if f.lower().endswith(".pdf")) if os.path.exists(docs_dir) else []
+    with st.expander("🔎 Search scope"):
+        scope_col1, scope_col2, scope_col3 = st.columns([2, 1, 1])
+        with scope_col1:
+            scope_doc = st.selectbox("Search in:", ["All documents"] + scope_pdfs, key="scope_doc")
+        with scope_col2:
+            first_page = st.number_input("From page:", min_value=0, value=0, step=1, key="scope_first", help="0 = first page")
+        with scope_col3:
+            last_page = st.number_input("To page:", min_value=0, value=0, step=1, key="scope_last", help="0 = last page")
+    scope_documents = [os.path.join("docs", scope_doc)] if scope_doc != "All documents" else None
+    scope_pages = (first_page or None, last_page or None) if (first_page or last_page) else None
+
+    # Input form
     with st.form(key=f"chat_form_{st.session_state.submission_count}"):
         user_question = st.text_input("Enter your question:", placeholder="E.g., What about gestational diabetes?")
         submit_button = st.form_submit_button("Send ➤", use_container_width=True)
@@ -574,8 +603,12 @@ if st.session_state.current_page == "chat":
             })
             
             # Get answer
+            timings = {}
             with st.spinner("Searching documents..."):
-                answer, sources = ask_question(user_question)
+                answer, sources = ask_question(user_question, timings=timings,
+                                               documents=scope_documents, page_range=scope_pages)
+            scope = {"documents": scope_documents, "pages": scope_pages} if (scope_documents or scope_pages) else None
+            history.log_query(st.session_state.session_id, user_question, answer, sources, timings, scope)
             
             # Save answer
             st.session_state.chat_history.append({
@@ -640,6 +673,51 @@ elif st.session_state.current_page == "documents":
         else:
             st.error("docs/ folder not found.")
 
+        # Upload & background indexing
+        st.divider()
+        st.markdown("📤 **Upload PDFs**")
+        with st.form(key=f"upload_form_{st.session_state.submission_count}"):
+            uploads = st.file_uploader("Choose PDF files", type=["pdf"], accept_multiple_files=True)
+            replace = st.checkbox("Replace documents with the same name")
+            upload_button = st.form_submit_button("Upload & Index", use_container_width=True)
+
+            if upload_button and uploads:
+                names = [os.path.basename(upload.name) for upload in uploads]
+                clashes = sorted({n for n in names if names.count(n) > 1})
+                if not replace:
+                    clashes += [n for n in names if os.path.exists(indexer.upload_path(n))]
+                if clashes:
+                    st.error("Already in docs/: " + ", ".join(dict.fromkeys(clashes))
+                             + ". Rename the files or tick \"Replace documents with the same name\".")
+                else:
+                    os.makedirs(docs_path, exist_ok=True)
+                    # One job per upload: all files go into a single new snapshot
+                    indexer.submit([indexer.save_upload(upload.name, upload.getvalue(), replace=replace)
+                                    for upload in uploads])
+                    st.session_state.submission_count += 1
+                    st.rerun()
+
+        # Polls while jobs are running; the whole page reruns once they finish
+        polling = any(indexer.is_active(job) for job in indexer.jobs())
+
+        @st.fragment(run_every=2 if polling else None)
+        def indexing_status():
+            jobs = indexer.jobs()
+            if not jobs:
+                return
+            st.markdown("⏳ **Indexing status**")
+            for job in jobs:
+                if job["status"] == "failed":
+                    st.error(f"{job['file']}: indexing failed ({job['error']})")
+                elif job["status"] == "done":
+                    st.success(f"{job['file']}: indexed {job['chunks']} chunks, now searchable")
+                else:
+                    st.progress(job["progress"], text=f"{job['file']}: {job['status']} ({job['chunks']} chunks)")
+            if polling and not any(indexer.is_active(job) for job in jobs):
+                st.rerun()
+
+        indexing_status()
+
 elif st.session_state.current_page == "settings":
     st.markdown("""
     <div style='margin-bottom: 24px;'>
@@ -716,7 +794,7 @@ elif st.session_state.current_page == "help":
         st.markdown("Answers are extracted directly from the source documents using AI-powered retrieval. Accuracy depends on the quality and relevance of source documents.")
     
     with st.expander("Can I upload my own documents?"):
-        st.markdown("Document upload feature is coming soon. Currently, documents in the docs/ folder are automatically indexed.")
+        st.markdown("Yes. Open the **Docs** page and use **Upload PDFs**. Files are indexed in the background and become searchable in the chat as soon as indexing finishes, without restarting the app.")
     
     st.divider()
     st.markdown("### 📧 Support")
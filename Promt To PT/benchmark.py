@@ -0,0 +1,288 @@
+# benchmark.py
+"""
+Latency and throughput benchmark for the RAG pipeline.
+
+Run from this folder:
+    python benchmark.py                          # full run, saves bench_results/<time>.json
+    python benchmark.py --compare bench_results/old.json
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# -----------------------------
+# Config
+# -----------------------------
+RESULTS_DIR = "bench_results"
+STAGES = ["embed", "retrieve", "filter", "sentence-embed", "format", "total"]
+DEFAULT_CONCURRENCY = [1, 2, 4, 8]
+DEFAULT_TOLERANCE = 0.10  # 10% slower / less throughput counts as a regression
+
+# Fixed question set over the bundled docs/ PDFs
+QUESTIONS = [
+    "What is gestational diabetes?",
+    "How is hyperglycaemia first detected in pregnancy diagnosed?",
+    "What are the diagnostic criteria for diabetes in pregnancy?",
+    "What fasting plasma glucose value indicates gestational diabetes?",
+    "What is the 75g oral glucose tolerance test?",
+    "What are the risks of hyperglycaemia in pregnancy for the baby?",
+    "Who should be screened for gestational diabetes?",
+    "What is the role of primary health care?",
+    "How can patient safety be improved in hospitals?",
+    "What are the main causes of hypertension?",
+    "How should chronic diseases be managed?",
+    "What is the capital of France?",  # out-of-corpus question
+]
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(values) -> dict:
+    """p50/p95/p99/mean in milliseconds."""
+    return {
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "count": len(values),
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 1)
+
+
+# -----------------------------
+# Benchmarks
+# -----------------------------
+def bench_ingest(docs_dir: str, use_text_cache: bool = False) -> dict:
+    """
+    Time a full ingest of docs_dir into a throwaway vectorstore.
+
+    The extracted-text cache (text_cache.py) is off unless use_text_cache is
+    set: with it, parse_s times gzip reads instead of pypdf from the second
+    run on.
+    """
+    import ingest
+
+    db_dir = tempfile.mkdtemp(prefix="bench_db_")
+    saved_setting, ingest.USE_TEXT_CACHE = ingest.USE_TEXT_CACHE, use_text_cache
+    try:
+        start = time.perf_counter()
+        embedding = ingest.get_embedding()
+        model_load = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pages = ingest.load_documents(docs_dir)
+        parse = time.perf_counter() - start
+
+        start = time.perf_counter()
+        chunks, dropped = ingest.split_documents(pages)
+        split = time.perf_counter() - start
+
+        start = time.perf_counter()
+        ingest.build_index(chunks, embedding, db_dir)
+        embed = time.perf_counter() - start
+    finally:
+        ingest.USE_TEXT_CACHE = saved_setting
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+    total = parse + split + embed
+    return {
+        "text_cache": use_text_cache,
+        "pages": len(pages),
+        "chunks": len(chunks),
+        "dropped_chunks": dropped,
+        "model_load_s": round(model_load, 3),
+        "parse_s": round(parse, 3),
+        "split_s": round(split, 3),
+        "embed_s": round(embed, 3),
+        "pages_per_sec": round(len(pages) / total, 2) if total else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_stages(ask_question, questions, repeats: int) -> dict:
+    """Run each question sequentially and collect per-stage latencies."""
+    samples = {stage: [] for stage in STAGES}
+    for _ in range(repeats):
+        for question in questions:
+            timings = {}
+            start = time.perf_counter()
+            ask_question(question, timings=timings)
+            timings["total"] = time.perf_counter() - start
+            for stage, seconds in timings.items():
+                samples[stage].append(seconds)
+    return {stage: summarize(values) for stage, values in samples.items() if values}
+
+
+def bench_scoped(ask_question, questions, documents, repeats: int) -> dict:
+    """Vector search latency unscoped vs. limited to each document (metadata prefilter)."""
+    scopes = {"all": None}
+    scopes.update({os.path.basename(doc): [doc] for doc in documents})
+    results = {}
+    for name, scope in scopes.items():
+        latencies = []
+        for _ in range(repeats):
+            for question in questions:
+                timings = {}
+                ask_question(question, timings=timings, documents=scope)
+                latencies.append(timings.get("retrieve", 0.0))
+        results[name] = summarize(latencies)
+    return results
+
+
+def bench_throughput(ask_question, questions, levels, repeats: int) -> dict:
+    """Measure QPS and latency with N concurrent callers."""
+    workload = questions * repeats
+    results = {}
+    for workers in levels:
+        latencies = []
+
+        def timed(question):
+            start = time.perf_counter()
+            ask_question(question)
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(timed, workload))
+        elapsed = time.perf_counter() - start
+
+        results[str(workers)] = {
+            "qps": round(len(workload) / elapsed, 3) if elapsed else 0.0,
+            "latency": summarize(latencies),
+        }
+    return results
+
+
+# -----------------------------
+# Regression check
+# -----------------------------
+def compare(current: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> list:
+    """Return human-readable regressions of current vs baseline."""
+    regressions = []
+
+    for stage, stats in current.get("stages", {}).items():
+        old = baseline.get("stages", {}).get(stage)
+        if old and old["p95_ms"] and stats["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append(f"stage {stage}: p95 {old['p95_ms']}ms -> {stats['p95_ms']}ms")
+
+    for workers, stats in current.get("throughput", {}).items():
+        old = baseline.get("throughput", {}).get(workers)
+        if old and stats["qps"] < old["qps"] * (1 - tolerance):
+            regressions.append(f"concurrency {workers}: qps {old['qps']} -> {stats['qps']}")
+
+    new_ingest, old_ingest = current.get("ingest"), baseline.get("ingest")
+    if new_ingest and old_ingest:
+        if new_ingest.get("text_cache") != old_ingest.get("text_cache"):
+            regressions.append(f"ingest: text cache {'on' if new_ingest.get('text_cache') else 'off'} here but "
+                               f"{'on' if old_ingest.get('text_cache') else 'off'} in the baseline; not comparable")
+        elif new_ingest["pages_per_sec"] < old_ingest["pages_per_sec"] * (1 - tolerance):
+            regressions.append(f"ingest: pages/sec {old_ingest['pages_per_sec']} -> {new_ingest['pages_per_sec']}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the healthcare RAG pipeline")
+    parser.add_argument("--docs", default="docs", help="PDF folder used for the ingest benchmark")
+    parser.add_argument("--repeats", type=int, default=3, help="Passes over the question set")
+    parser.add_argument("--concurrency", default=",".join(map(str, DEFAULT_CONCURRENCY)),
+                        help="Comma-separated concurrency levels")
+    parser.add_argument("--skip-ingest", action="store_true", help="Only benchmark queries")
+    parser.add_argument("--text-cache", action="store_true",
+                        help="Parse PDFs through the extracted-text cache (off by default: times pypdf)")
+    parser.add_argument("--output", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "questions": len(QUESTIONS),
+        "repeats": args.repeats,
+    }
+
+    # Ingest runs first so its peak RSS is not inflated by the query-side model
+    if not args.skip_ingest:
+        print("Benchmarking ingest...")
+        results["ingest"] = bench_ingest(args.docs, args.text_cache)
+
+    print("Loading pipeline...")
+    start = time.perf_counter()
+    import rag_pipeline
+    from rag_pipeline import ask_question
+    results["pipeline_load_s"] = round(time.perf_counter() - start, 3)
+    # Repeated questions would otherwise measure the caches, not the pipeline
+    rag_pipeline.answer_cache.maxsize = 0
+    rag_pipeline.embedding.cache.maxsize = 0
+    ask_question(QUESTIONS[0])  # warm-up, not measured
+
+    print("Benchmarking stages...")
+    results["stages"] = bench_stages(ask_question, QUESTIONS, args.repeats)
+
+    print("Benchmarking document-scoped retrieval...")
+    catalog = rag_pipeline.get_catalog()
+    documents = sorted(catalog) if catalog else [
+        os.path.join(args.docs, f) for f in sorted(os.listdir(args.docs)) if f.endswith(".pdf")
+    ]
+    results["scoped_retrieve"] = bench_scoped(ask_question, QUESTIONS, documents, args.repeats)
+
+    print("Benchmarking throughput...")
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    results["throughput"] = bench_throughput(ask_question, QUESTIONS, levels, args.repeats)
+    results["peak_rss_mb"] = peak_rss_mb()
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    for stage, stats in results["stages"].items():
+        print(f"  {stage:<15} p50 {stats['p50_ms']:>9.2f}ms  p95 {stats['p95_ms']:>9.2f}ms  p99 {stats['p99_ms']:>9.2f}ms")
+    for scope, stats in results["scoped_retrieve"].items():
+        print(f"  retrieve in {scope:<28} p50 {stats['p50_ms']:>9.2f}ms  p95 {stats['p95_ms']:>9.2f}ms")
+    for workers, stats in results["throughput"].items():
+        print(f"  concurrency {workers:<3} {stats['qps']:>8.2f} qps  p95 {stats['latency']['p95_ms']:.2f}ms")
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions vs baseline:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("No regressions vs baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# caches.py
+"""
+In-process caches for the query path.
+
+Hits and misses are counted in metrics as cache_hit_total / cache_miss_total
+labelled with the cache name. A cache with maxsize 0 is disabled.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import metrics
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe least-recently-used map."""
+
+    def __init__(self, name: str, maxsize: int):
+        self.name = name
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is not _MISSING:
+                self._data.move_to_end(key)
+        if value is _MISSING:
+            if self.maxsize:
+                metrics.increment("cache_miss_total", cache=self.name)
+            return default
+        metrics.increment("cache_hit_total", cache=self.name)
+        return value
+
+    def put(self, key, value):
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings object, caching embed_query(); embed_documents() passes through.
+
+    Vectors are kept as float32 arrays (~3 KB for 768 dims instead of ~25 KB
+    as a list of Python floats) and converted back to lists when returned.
+    """
+
+    def __init__(self, base, maxsize: int):
+        self.base = base
+        self.cache = LRUCache("query_embedding", maxsize)
+
+    def embed_query(self, text: str) -> list:
+        vector = self.cache.get(text)
+        if vector is None:
+            vector = np.asarray(self.base.embed_query(text), dtype=np.float32)
+            self.cache.put(text, vector)
+        return vector.tolist()
+
+    def embed_documents(self, texts) -> list:
+        return self.base.embed_documents(texts)
+
+    def prefill(self, texts) -> int:
+        """Embed the uncached texts in one batch and cache them as queries. Returns how many were new."""
+        # No query instruction is configured, so embed_documents() gives the same vectors as embed_query()
+        missing = list(dict.fromkeys(t for t in texts if t not in self.cache))
+        if missing:
+            for text, vector in zip(missing, self.base.embed_documents(missing)):
+                self.cache.put(text, np.asarray(vector, dtype=np.float32))
+        return len(missing)
@@ -0,0 +1,114 @@
+# chunk_quality.py
+import re
+
+# -----------------------------
+# Config
+# -----------------------------
+MIN_WORDS = 20            # Chunks shorter than this are not useful answers
+MAX_SYMBOL_RATIO = 0.3    # More than 30% formatting characters -> junk
+MAX_NUMERIC_RATIO = 0.5   # Mostly numbers -> table of figures
+MAX_TOC_LINE_RATIO = 0.5  # Mostly "Title ........ 12" lines -> table of contents
+MIN_QUALITY = 0.2         # Chunks scoring below this are dropped at ingest
+
+# Metadata keys written at ingest and read back by rag_pipeline
+QUALITY_KEY = "quality"
+SENTENCES_KEY = "sentences"
+SENTENCE_SEP = "\n"
+
+# Pre-compiled patterns (compiled once, reused for every chunk)
+_QA_WHAT_RE = re.compile(r'[Ww]hat\s+is\s+[^?]*\?\s*[Aa]nswer:\s*')
+_QA_QUESTION_RE = re.compile(r'[Qq]uestion:\s*[^?]*\?\s*[Aa]nswer:\s*')
+_QA_ANSWER_RE = re.compile(r'[Aa]nswer:\s+')
+_SENTENCE_SPLIT_RE = re.compile(r'[\.\n]+')
+_SYMBOL_RE = re.compile(r'[^\w .]|_')
+_NUMERIC_WORD_RE = re.compile(r'[\d.,%()\-–/]+')
+_TOC_LINE_RE = re.compile(r'^.*(?:\.{3,}|…{2,}|\s{3,})\s*\d{1,4}\s*$', re.MULTILINE)
+_EXAMPLE_PREFIXES = ('examples', 'e.g.', 'for example')
+
+
+def clean_text(text: str) -> str:
+    """Strip "What is X? Answer:" style Q&A scaffolding from a chunk."""
+    text = _QA_WHAT_RE.sub('', text)
+    text = _QA_QUESTION_RE.sub('', text)
+    return _QA_ANSWER_RE.sub('', text)
+
+
+def split_sentences(text: str) -> list:
+    """Clean a chunk and return the sentences worth embedding at query time."""
+    sentences = [s.strip() for s in _SENTENCE_SPLIT_RE.split(clean_text(text)) if s.strip()]
+
+    # Basic candidate filtering (length, not labels, not examples)
+    candidates = []
+    for sentence in sentences:
+        if len(sentence) < 15 or len(sentence) > 350:
+            continue
+        if sentence[0].isdigit() or sentence.isupper() or ':' in sentence[:50]:
+            continue
+        if sentence.lower().startswith(_EXAMPLE_PREFIXES):
+            continue
+        candidates.append(sentence)
+    return candidates
+
+
+def score_chunk(text: str) -> float:
+    """
+    Score a chunk between 0 (junk) and 1 (clean prose).
+
+    Chunks that are too short, mostly symbols, mostly numbers or look like
+    a table of contents score 0.
+    """
+    content = text.strip()
+    if not content:
+        return 0.0
+
+    words = content.split()
+    if len(words) < MIN_WORDS:
+        return 0.0
+
+    symbol_ratio = len(_SYMBOL_RE.findall(content)) / len(content)
+    if symbol_ratio > MAX_SYMBOL_RATIO:
+        return 0.0
+
+    numeric_ratio = sum(1 for w in words if _NUMERIC_WORD_RE.fullmatch(w)) / len(words)
+    if numeric_ratio > MAX_NUMERIC_RATIO:
+        return 0.0
+
+    line_count = content.count('\n') + 1
+    toc_ratio = len(_TOC_LINE_RE.findall(content)) / line_count
+    if toc_ratio > MAX_TOC_LINE_RATIO:
+        return 0.0
+
+    return round((1 - symbol_ratio) * (1 - numeric_ratio) * (1 - toc_ratio), 4)
+
+
+def annotate_chunks(chunks: list) -> list:
+    """
+    Store a quality score and pre-cleaned sentences in each chunk's metadata
+    and return only the chunks worth embedding.
+    """
+    kept = []
+    for chunk in chunks:
+        score = score_chunk(chunk.page_content)
+        if score < MIN_QUALITY:
+            continue
+        chunk.metadata[QUALITY_KEY] = score
+        # Chroma metadata must be scalar, so the sentence list is stored joined
+        chunk.metadata[SENTENCES_KEY] = SENTENCE_SEP.join(split_sentences(chunk.page_content))
+        kept.append(chunk)
+    return kept
+
+
+def chunk_quality(doc) -> float:
+    """Quality of a retrieved chunk, falling back to scoring it for older indexes."""
+    score = doc.metadata.get(QUALITY_KEY) if isinstance(doc.metadata, dict) else None
+    if score is None:
+        score = score_chunk(doc.page_content)
+    return score
+
+
+def chunk_sentences(doc) -> list:
+    """Pre-cleaned sentences of a retrieved chunk, computed on the fly for older indexes."""
+    stored = doc.metadata.get(SENTENCES_KEY) if isinstance(doc.metadata, dict) else None
+    if stored is None:
+        return split_sentences(doc.page_content)
+    return [s for s in stored.split(SENTENCE_SEP) if s]
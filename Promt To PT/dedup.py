@@ -0,0 +1,177 @@
+# dedup.py
+"""
+Near-duplicate chunk elimination with MinHash + LSH.
+
+Boilerplate repeated across pages and documents (headers, disclaimers,
+reference lists) is collapsed into one chunk, which keeps the references of
+every copy in metadata["refs"] ("source#page|source#page|..."), the page
+span of its copies in metadata["page_first"/"page_last"] and one flag
+metadata["in:<source>"] = True per document it stands for. Document filters
+(source_filter) match on those flags, so a shared chunk is found whichever
+of its documents a query is scoped to.
+"""
+import re
+import zlib
+
+import numpy as np
+
+# -----------------------------
+# Config
+# -----------------------------
+NUM_PERM = 128           # MinHash permutations
+BANDS = 16               # LSH bands (rows per band = NUM_PERM // BANDS)
+SHINGLE_WORDS = 5        # words per shingle
+JACCARD_THRESHOLD = 0.8  # estimated similarity needed to merge two chunks
+SEED = 1                 # fixed, so signatures are stable across runs
+
+REFS_KEY = "refs"
+DUPLICATES_KEY = "duplicates"
+PAGE_FIRST_KEY = "page_first"
+PAGE_LAST_KEY = "page_last"
+MEMBER_PREFIX = "in:"
+REF_SEP = "|"
+
+_WORD_RE = re.compile(r"\w+")
+_rng = np.random.default_rng(SEED)
+_A = _rng.integers(1, 2**63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2**63, size=NUM_PERM, dtype=np.uint64)
+
+
+def _shingles(text: str) -> np.ndarray:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return np.empty(0, dtype=np.uint64)
+    grams = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+def signature(text: str):
+    """MinHash signature of a chunk (None when it is too short to shingle)."""
+    shingles = _shingles(text)
+    if not shingles.size:
+        return None
+    # Multiply-shift hashing: uint64 arithmetic wraps, the high 32 bits are the hash
+    hashes = (np.outer(shingles, _A) + _B) >> np.uint64(32)
+    return hashes.min(axis=0)
+
+
+def _ref(doc) -> str:
+    return f"{doc.metadata.get('source', 'Unknown')}#{doc.metadata.get('page', '?')}"
+
+
+def member_key(source) -> str:
+    """Metadata key flagging that a collapsed chunk stands for source."""
+    return f"{MEMBER_PREFIX}{source}"
+
+
+def member_sources(metadata: dict) -> list:
+    """Documents a chunk stands for: its flagged documents, else its own source."""
+    flagged = [k[len(MEMBER_PREFIX):] for k, v in metadata.items() if k.startswith(MEMBER_PREFIX) and v]
+    return flagged or [metadata.get("source", "Unknown")]
+
+
+def member_pages(metadata: dict) -> dict:
+    """{source: [pages]} of every copy a chunk stands for (0-based pages)."""
+    pages = {}
+    refs = [r for r in (metadata.get(REFS_KEY) or "").split(REF_SEP) if "#" in r]
+    if not refs:
+        return {metadata.get("source", "Unknown"): [metadata.get("page")]}
+    for ref in refs:
+        source, page = ref.rsplit("#", 1)
+        pages.setdefault(source, []).append(int(page) if page.isdigit() else page)
+    return pages
+
+
+def source_filter(sources) -> dict:
+    """Chroma where-clause for chunks standing for any of sources, collapsed or not."""
+    sources = list(sources)
+    own = {"source": sources[0]} if len(sources) == 1 else {"source": {"$in": sources}}
+    return {"$or": [own] + [{member_key(s): True} for s in sources]}
+
+
+def _set_members(metadata: dict, refs: list):
+    """Rewrite the member flags and page span of metadata from its refs."""
+    for key in [k for k in metadata if k.startswith(MEMBER_PREFIX)]:
+        del metadata[key]
+    metadata.pop(PAGE_FIRST_KEY, None)
+    metadata.pop(PAGE_LAST_KEY, None)
+    pages = []
+    for ref in refs:
+        source, page = ref.rsplit("#", 1)
+        metadata[member_key(source)] = True
+        if page.isdigit():
+            pages.append(int(page))
+    if len(pages) > 1:
+        metadata[PAGE_FIRST_KEY], metadata[PAGE_LAST_KEY] = min(pages), max(pages)
+
+
+def collapse(chunks) -> tuple:
+    """
+    Merge near-duplicate chunks, within and across documents.
+
+    The first chunk of each group is kept (the best quality one when chunks
+    carry a quality score) and records every member's reference.
+
+    Returns:
+        kept: list of chunks to embed
+        removed: number of duplicate chunks dropped
+    """
+    signatures = [signature(c.page_content) for c in chunks]
+    parent = list(range(len(chunks)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    rows = NUM_PERM // BANDS
+    for band in range(BANDS):
+        buckets = {}
+        for i, sig in enumerate(signatures):
+            if sig is None:
+                continue
+            key = sig[band * rows:(band + 1) * rows].tobytes()
+            j = buckets.setdefault(key, i)
+            if j == i:
+                continue
+            root_i, root_j = find(i), find(j)
+            # Verify the LSH candidate before merging
+            if root_i != root_j and np.mean(signatures[i] == signatures[j]) >= JACCARD_THRESHOLD:
+                parent[root_i] = root_j
+
+    groups = {}
+    for i in range(len(chunks)):
+        groups.setdefault(find(i), []).append(i)
+
+    kept = []
+    for members in sorted(groups.values()):
+        best = max(members, key=lambda i: (chunks[i].metadata.get("quality", 0), -i))
+        chunk = chunks[best]
+        if len(members) > 1:
+            refs = list(dict.fromkeys(_ref(chunks[i]) for i in [best] + [m for m in members if m != best]))
+            chunk.metadata[REFS_KEY] = REF_SEP.join(refs)
+            chunk.metadata[DUPLICATES_KEY] = len(members) - 1
+            _set_members(chunk.metadata, refs)
+        kept.append(chunk)
+    return kept, len(chunks) - len(kept)
+
+
+def drop_source(metadata: dict, source: str):
+    """
+    Metadata for a kept chunk once source is removed from the index.
+
+    Returns None when the chunk only stood for source (delete it); otherwise
+    the chunk is re-pointed at its next remaining reference.
+    """
+    refs = [r for r in (metadata.get(REFS_KEY) or "").split(REF_SEP) if r and r.rsplit("#", 1)[0] != source]
+    if not refs:
+        return None
+    new_source, page = refs[0].rsplit("#", 1)
+    metadata = dict(metadata)
+    metadata["source"] = new_source
+    metadata["page"] = int(page) if page.isdigit() else page
+    metadata[REFS_KEY] = REF_SEP.join(refs)
+    metadata[DUPLICATES_KEY] = len(refs) - 1
+    _set_members(metadata, refs)
+    return metadata
@@ -0,0 +1,294 @@
+# embed_server.py
+"""
+Shared embedding server, so app workers and batch jobs load bge-base once.
+
+    python embed_server.py                                  # 127.0.0.1:8610
+    python embed_server.py --address unix:/tmp/rag-embed.sock
+
+rag_pipeline.py and ingest.py use get_embedding(), which returns a pooled
+client when a server for the same model is listening at RAG_EMBED_SERVER
+(default 127.0.0.1:8610) and the in-process model otherwise. Set
+RAG_EMBED_SERVER=off to always embed in-process.
+
+Protocol: one JSON line per request ({"texts": [...]} or {"op": "info"}),
+answered by one JSON line ({"count", "dim"} or {"error"}) followed by
+count * dim little-endian float32 values.
+"""
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import metrics
+
+# -----------------------------
+# Config
+# -----------------------------
+DEFAULT_ADDRESS = "127.0.0.1:8610"
+DEFAULT_MODEL = "BAAI/bge-base-en"
+MAX_BATCH = 64          # texts embedded together by the server
+MAX_WAIT_MS = 5         # how long the server holds a batch open for more requests
+CLIENT_BATCH = 64       # texts per request, so big ingest calls don't starve queries
+POOL_SIZE = 8           # idle connections kept by a client
+CONNECT_TIMEOUT = 0.5   # seconds; also bounds the startup probe
+REQUEST_TIMEOUT = 60.0  # seconds per request
+
+
+def _parse_address(address: str):
+    """(socket family, address) for "unix:/path.sock" or "host:port"."""
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+# -----------------------------
+# Server
+# -----------------------------
+class _Batcher:
+    """Single model thread that merges concurrent requests into one forward pass."""
+
+    def __init__(self, embedding, max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS):
+        self.embedding = embedding
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name="rag-embed-batcher", daemon=True).start()
+
+    def embed(self, texts: list) -> np.ndarray:
+        pending = {"texts": texts, "done": threading.Event(), "result": None, "error": None}
+        self._queue.put(pending)
+        pending["done"].wait()
+        if pending["error"] is not None:
+            raise pending["error"]
+        return pending["result"]
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0]["texts"])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(pending)
+                size += len(pending["texts"])
+
+            texts = [text for pending in batch for text in pending["texts"]]
+            try:
+                vectors = np.asarray(self.embedding.embed_documents(texts), dtype="<f4")
+                offset = 0
+                for pending in batch:
+                    count = len(pending["texts"])
+                    pending["result"] = vectors[offset:offset + count]
+                    offset += count
+            except Exception as e:
+                for pending in batch:
+                    pending["error"] = e
+            for pending in batch:
+                pending["done"].set()
+
+
+def serve(address: str = DEFAULT_ADDRESS, model_name: str = DEFAULT_MODEL,
+          max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS):
+    """Load model_name once and serve embeddings at address until interrupted."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    embedding = HuggingFaceEmbeddings(model_name=model_name)
+    dim = len(embedding.embed_query("dimension probe"))
+    batcher = _Batcher(embedding, max_batch, max_wait_ms)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            # Connections are persistent: serve requests until the client hangs up
+            for line in self.rfile:
+                request = json.loads(line)
+                payload = b""
+                if request.get("op") == "info":
+                    header = {"model": model_name, "dim": dim}
+                else:
+                    try:
+                        vectors = batcher.embed(request["texts"])
+                        header = {"count": len(vectors), "dim": dim}
+                        payload = vectors.tobytes()
+                    except Exception as e:
+                        header = {"error": str(e)}
+                self.wfile.write(json.dumps(header).encode("utf-8") + b"\n" + payload)
+                self.wfile.flush()
+
+    family, bind = _parse_address(address)
+    if family == socket.AF_INET:
+        server_class = socketserver.ThreadingTCPServer
+    else:
+        server_class = socketserver.ThreadingUnixStreamServer
+        if os.path.exists(bind):
+            os.remove(bind)  # stale socket from a previous run
+    server_class.daemon_threads = True
+    server_class.allow_reuse_address = True
+    server = server_class(bind, Handler)
+    print(f"Serving {model_name} embeddings on {address} (batch {max_batch}, wait {max_wait_ms}ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Embedding server stopped.")
+    finally:
+        server.server_close()
+        if family != socket.AF_INET and os.path.exists(bind):
+            os.remove(bind)
+
+
+# -----------------------------
+# Client
+# -----------------------------
+class EmbeddingClient(Embeddings):
+    """
+    LangChain Embeddings backed by the embedding server, with pooled connections.
+
+    If the server goes away mid-run the client switches to local(), an
+    in-process model factory, instead of failing requests.
+    """
+
+    def __init__(self, address: str, model_name: str, local=None, pool_size: int = POOL_SIZE):
+        self.address = address
+        self.model_name = model_name
+        self._family, self._address = _parse_address(address)
+        self._local_factory = local
+        self._local = None
+        self._lock = threading.Lock()
+        self._idle = queue.LifoQueue()
+        self._pool_size = pool_size
+
+    def _connect(self):
+        sock = socket.socket(self._family, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(self._address)
+            sock.settimeout(REQUEST_TIMEOUT)
+        except OSError:
+            sock.close()
+            raise
+        return sock, sock.makefile("rb")
+
+    def _close(self, conn):
+        sock, reader = conn
+        reader.close()
+        sock.close()
+
+    def _send(self, conn, request: dict):
+        sock, reader = conn
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("embedding server closed the connection")
+        header = json.loads(line)
+        size = header.get("count", 0) * header.get("dim", 0) * 4
+        payload = reader.read(size) if size else b""
+        if len(payload) != size:
+            raise ConnectionError("truncated response from embedding server")
+        return header, payload
+
+    def _request(self, request: dict):
+        try:
+            conn, pooled = self._idle.get_nowait(), True
+        except queue.Empty:
+            conn, pooled = self._connect(), False
+        # ValueError: corrupt or partial header; the connection is out of sync, never reuse it
+        try:
+            header, payload = self._send(conn, request)
+        except (OSError, ValueError):
+            self._close(conn)
+            if not pooled:
+                raise
+            # The idle connection went stale (e.g. server restarted): retry once on a fresh one
+            conn = self._connect()
+            try:
+                header, payload = self._send(conn, request)
+            except (OSError, ValueError):
+                self._close(conn)
+                raise
+        if self._idle.qsize() < self._pool_size:
+            self._idle.put(conn)
+        else:
+            self._close(conn)
+        return header, payload
+
+    def info(self) -> dict:
+        return self._request({"op": "info"})[0]
+
+    def _local_embedding(self):
+        with self._lock:
+            if self._local is None:
+                print(f"Embedding server at {self.address} unavailable, loading {self.model_name} in-process")
+                self._local = self._local_factory()
+            return self._local
+
+    def embed_documents(self, texts) -> list:
+        texts = list(texts)
+        if self._local is not None:
+            return self._local.embed_documents(texts)
+        vectors = []
+        try:
+            for start in range(0, len(texts), CLIENT_BATCH):
+                header, payload = self._request({"texts": texts[start:start + CLIENT_BATCH]})
+                if "error" in header:
+                    raise RuntimeError(f"embedding server: {header['error']}")
+                vectors.extend(np.frombuffer(payload, dtype="<f4").reshape(header["count"], header["dim"]).tolist())
+        except (OSError, ValueError):
+            if self._local_factory is None:
+                raise
+            metrics.increment("embedding_server_fallback_total")
+            return self._local_embedding().embed_documents(texts)
+        return vectors
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_documents([text])[0]
+
+
+def get_embedding(model_name: str, local, address: str = None):
+    """
+    Embeddings for model_name: the shared server when one is running, else local().
+
+    Args:
+        local: zero-argument factory of the in-process embedding model
+        address: server address; defaults to RAG_EMBED_SERVER or DEFAULT_ADDRESS
+    """
+    address = address or os.getenv("RAG_EMBED_SERVER", DEFAULT_ADDRESS)
+    if address.lower() in ("off", "0", "none"):
+        return local()
+    client = EmbeddingClient(address, model_name, local)
+    try:
+        info = client.info()
+    except (OSError, ValueError):
+        return local()
+    if info.get("model") != model_name:
+        print(f"Embedding server at {address} serves {info.get('model')}, not {model_name}; embedding in-process")
+        return local()
+    print(f"Using embedding server at {address}")
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared embedding server for the RAG app and ingest")
+    parser.add_argument("--address", default=os.getenv("RAG_EMBED_SERVER", DEFAULT_ADDRESS),
+                        help='"host:port" or "unix:/path/to.sock"')
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    args = parser.parse_args()
+    serve(args.address, args.model, args.max_batch, args.max_wait_ms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# evaluate.py
+"""
+Retrieval quality + speed evaluation over a labelled question -> page set.
+
+Sweeps chunking (chunk_size / overlap), near-duplicate collapsing, k and
+the key-point similarity threshold, and reports recall@k, MRR and answer-hit rate next to latency
+and index size, so speed changes can be checked for quality regressions.
+
+Run from this folder:
+    python evaluate.py
+    python evaluate.py --chunk-sizes 128,256,510 --ks 2,4,8 --thresholds 0.4,0.45,0.5
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import dedup
+import ingest
+from benchmark import summarize
+
+# -----------------------------
+# Config
+# -----------------------------
+EVAL_SET = "eval_set.jsonl"
+RESULTS_DIR = "eval_results"
+
+
+def load_eval_set(path: str = EVAL_SET) -> list:
+    """Each line: {"question", "source", "pages" (0-based), "answer_terms"}."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def dir_size_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return round(total / (1024 * 1024), 3)
+
+
+def _basename(source) -> str:
+    return os.path.basename(str(source).replace("\\", "/"))
+
+
+def relevant_pages(doc, item) -> set:
+    """Labelled pages a retrieved chunk stands for, including collapsed copies in metadata["refs"]."""
+    locations = {(_basename(doc.metadata.get("source", "")), doc.metadata.get("page"))}
+    for ref in (doc.metadata.get(dedup.REFS_KEY) or "").split(dedup.REF_SEP):
+        if "#" in ref:
+            source, page = ref.rsplit("#", 1)
+            locations.add((_basename(source), int(page) if page.isdigit() else page))
+    return {page for source, page in locations if source == item["source"] and page in item["pages"]}
+
+
+def is_relevant(doc, item) -> bool:
+    return bool(relevant_pages(doc, item))
+
+
+def answer_hit(answer: str, item) -> bool:
+    answer = answer.lower()
+    return any(term.lower() in answer for term in item["answer_terms"])
+
+
+# -----------------------------
+# Evaluation
+# -----------------------------
+def eval_retrieval(vectorstore, items, k: int) -> dict:
+    """recall@k (share of labelled pages found), hit@k and MRR for one index."""
+    recalls, hits, reciprocal_ranks, latencies = [], [], [], []
+    for item in items:
+        start = time.perf_counter()
+        docs = vectorstore.similarity_search(item["question"], k=k)
+        latencies.append(time.perf_counter() - start)
+
+        found_pages = set().union(*(relevant_pages(d, item) for d in docs))
+        recalls.append(len(found_pages) / len(item["pages"]))
+        hits.append(1.0 if found_pages else 0.0)
+        rank = next((i + 1 for i, d in enumerate(docs) if is_relevant(d, item)), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+
+    n = len(items)
+    return {
+        f"recall@{k}": round(sum(recalls) / n, 4),
+        f"hit@{k}": round(sum(hits) / n, 4),
+        "mrr": round(sum(reciprocal_ranks) / n, 4),
+        "search_latency": summarize(latencies),
+    }
+
+
+def eval_answers(rag_pipeline, items, threshold: float) -> dict:
+    """Answer-hit rate and end-to-end latency of ask_question at one threshold."""
+    rag_pipeline.SIMILARITY_THRESHOLD = threshold
+    hits, latencies = [], []
+    for item in items:
+        start = time.perf_counter()
+        answer, _ = rag_pipeline.ask_question(item["question"])
+        latencies.append(time.perf_counter() - start)
+        hits.append(1.0 if answer_hit(answer, item) else 0.0)
+    return {
+        "answer_hit_rate": round(sum(hits) / len(items), 4),
+        "latency": summarize(latencies),
+    }
+
+
+def sweep(items, docs_dir, chunk_sizes, overlaps, dedups, ks, thresholds) -> list:
+    import rag_pipeline
+
+    default_k, default_threshold = rag_pipeline.TOP_K, rag_pipeline.SIMILARITY_THRESHOLD
+    # Each configuration must pay for its own query embeddings and answers
+    rag_pipeline.answer_cache.maxsize = 0
+    rag_pipeline.embedding.cache.maxsize = 0
+    pages = ingest.load_documents(docs_dir)
+    results = []
+    try:
+        for chunk_size, overlap, use_dedup in itertools.product(chunk_sizes, overlaps, dedups):
+            db_dir = tempfile.mkdtemp(prefix="eval_db_")
+            try:
+                start = time.perf_counter()
+                chunks, dropped = ingest.split_documents(pages, chunk_size, overlap)
+                duplicates = 0
+                if use_dedup:
+                    chunks, duplicates = dedup.collapse(chunks)
+                ingest.build_index(chunks, rag_pipeline.embedding, db_dir)
+                index = {
+                    "chunks": len(chunks),
+                    "dropped_chunks": dropped,
+                    "duplicate_chunks": duplicates,
+                    "build_s": round(time.perf_counter() - start, 3),
+                    "size_mb": dir_size_mb(db_dir),
+                }
+
+                for k in ks:
+                    vectorstore = rag_pipeline.load_vectorstore(db_dir, k)
+                    retrieval = eval_retrieval(vectorstore, items, k)
+                    for threshold in thresholds:
+                        row = {
+                            "chunk_size": chunk_size,
+                            "chunk_overlap": overlap,
+                            "dedup": bool(use_dedup),
+                            "k": k,
+                            "threshold": threshold,
+                            "index": index,
+                            "retrieval": retrieval,
+                            "answers": eval_answers(rag_pipeline, items, threshold),
+                        }
+                        results.append(row)
+                        print(f"  size={chunk_size} overlap={overlap} dedup={bool(use_dedup)} k={k} thr={threshold}: "
+                              f"chunks={index['chunks']} recall@{k}={retrieval[f'recall@{k}']} "
+                              f"mrr={retrieval['mrr']} hit={row['answers']['answer_hit_rate']} "
+                              f"search p95={retrieval['search_latency']['p95_ms']}ms "
+                              f"answer p95={row['answers']['latency']['p95_ms']}ms")
+            finally:
+                shutil.rmtree(db_dir, ignore_errors=True)
+    finally:
+        rag_pipeline.SIMILARITY_THRESHOLD = default_threshold
+        rag_pipeline.load_vectorstore(rag_pipeline.DB_DIR, default_k)
+    return results
+
+
+def _floats(value: str) -> list:
+    return [float(v) for v in value.split(",") if v.strip()]
+
+
+def _ints(value: str) -> list:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality and speed")
+    parser.add_argument("--eval-set", default=EVAL_SET)
+    parser.add_argument("--docs", default=ingest.DOCS_DIR)
+    parser.add_argument("--chunk-sizes", type=_ints, default=[ingest.CHUNK_SIZE], help="Chunk sizes in tokens")
+    parser.add_argument("--overlaps", type=_ints, default=[ingest.CHUNK_OVERLAP], help="Chunk overlaps in tokens")
+    parser.add_argument("--dedup", type=_ints, default=[int(ingest.DEDUP)],
+                        help="Near-duplicate collapsing off/on, e.g. 0,1 to compare")
+    parser.add_argument("--ks", type=_ints, default=[2, 4, 8])
+    parser.add_argument("--thresholds", type=_floats, default=[0.35, 0.45, 0.55])
+    parser.add_argument("--output", help="Where to write the JSON results")
+    args = parser.parse_args()
+
+    items = load_eval_set(args.eval_set)
+    print(f"Evaluating {len(items)} labelled questions...")
+    results = sweep(items, args.docs, args.chunk_sizes, args.overlaps, args.dedup, args.ks, args.thresholds)
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"eval_set": args.eval_set, "questions": len(items), "results": results}, f, indent=2)
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+# history.py
+"""
+Persistent chat history and query log (SQLite in WAL mode).
+
+log_query() only enqueues; a background thread writes batches in one
+transaction, so logging never adds disk I/O to a request. Identical
+answers are stored once. Rows older than RETENTION_DAYS are removed by
+compact(), which the writer runs every COMPACT_INTERVAL seconds.
+
+    python history.py top --limit 20
+    python history.py compact --days 30
+"""
+import argparse
+import atexit
+import hashlib
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+import metrics
+
+# -----------------------------
+# Config
+# -----------------------------
+DB_PATH = os.getenv("RAG_HISTORY_DB", os.path.join("logs", "history.sqlite3"))
+RETENTION_DAYS = 90
+BATCH_SIZE = 100           # rows per write transaction
+FLUSH_INTERVAL = 1.0       # seconds a batch waits for more rows
+MAX_PENDING = 10000        # queued rows before new ones are dropped
+COMPACT_INTERVAL = 6 * 3600
+
+_enabled = os.getenv("RAG_HISTORY", "1").lower() not in ("0", "false", "no")
+_queue = queue.Queue(maxsize=MAX_PENDING)
+_writer = None
+_writer_lock = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    started REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY,
+    hash TEXT UNIQUE NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS queries (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    question TEXT NOT NULL,
+    question_key TEXT NOT NULL,  -- hash of the normalized question, for frequency counts
+    answer_id INTEGER REFERENCES answers(id),
+    sources TEXT,                -- JSON list
+    scope TEXT,                  -- JSON {"documents", "pages"} or NULL
+    total_ms REAL,
+    stages TEXT                  -- JSON {stage: ms}
+);
+CREATE INDEX IF NOT EXISTS queries_ts ON queries(ts);
+CREATE INDEX IF NOT EXISTS queries_session ON queries(session_id, ts);
+CREATE INDEX IF NOT EXISTS queries_question ON queries(question_key);
+"""
+
+
+def connect(path: str = None) -> sqlite3.Connection:
+    path = path or DB_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")  # only takes effect on a new file
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")       # durable enough in WAL mode, fewer fsyncs
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def question_key(question: str) -> str:
+    """Questions differing only in case, spacing or trailing punctuation share a key."""
+    normalized = re.sub(r"\s+", " ", question.strip().lower()).rstrip("?!. ")
+    return metrics.question_hash(normalized)
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """Stop logging new queries; rows already queued are still written."""
+    global _enabled
+    _enabled = False
+
+
+# -----------------------------
+# Writing
+# -----------------------------
+def log_query(session_id: str, question: str, answer: str, sources=None, timings: dict = None, scope: dict = None):
+    """Queue one question/answer for writing. Never blocks on disk."""
+    if not _enabled:
+        return
+    _start_writer()
+    record = (session_id, time.time(), question, answer, list(sources or []), dict(timings or {}), scope)
+    try:
+        _queue.put_nowait(record)
+    except queue.Full:
+        metrics.increment("history_dropped_total")
+
+
+def flush(timeout: float = 5.0) -> bool:
+    """Wait until queued rows are written (True) or timeout expires (False)."""
+    deadline = time.monotonic() + timeout
+    while _queue.unfinished_tasks:
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def _start_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_run, name="rag-history-writer", daemon=True)
+            _writer.start()
+            atexit.register(flush)
+
+
+def _run():
+    conn = connect()
+    last_compact = time.monotonic()
+    while True:
+        batch = [_queue.get()]
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while len(batch) < BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            _write(conn, batch)
+        except sqlite3.Error as e:
+            metrics.increment("history_write_errors_total")
+            print(f"History: could not write {len(batch)} rows: {e}")
+        finally:
+            for _ in batch:
+                _queue.task_done()
+
+        if time.monotonic() - last_compact >= COMPACT_INTERVAL:
+            last_compact = time.monotonic()
+            try:
+                compact(conn=conn)
+            except sqlite3.Error as e:
+                print(f"History: compaction failed: {e}")
+
+
+def _write(conn, batch):
+    with conn:
+        for session_id, ts, question, answer, sources, timings, scope in batch:
+            conn.execute(
+                "INSERT INTO sessions (id, started, last_seen) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET last_seen = excluded.last_seen",
+                (session_id, ts, ts),
+            )
+            answer_id = None
+            if answer is not None:
+                answer_hash = hashlib.sha1(answer.encode("utf-8")).hexdigest()
+                conn.execute("INSERT OR IGNORE INTO answers (hash, text) VALUES (?, ?)", (answer_hash, answer))
+                answer_id = conn.execute("SELECT id FROM answers WHERE hash = ?", (answer_hash,)).fetchone()[0]
+            total = timings.get("total")
+            stages = {stage: round(seconds * 1000, 1) for stage, seconds in timings.items() if stage != "total"}
+            conn.execute(
+                "INSERT INTO queries (session_id, ts, question, question_key, answer_id, sources, scope, total_ms, stages) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    session_id, ts, question, question_key(question), answer_id,
+                    json.dumps(sources, separators=(",", ":")),
+                    json.dumps(scope, separators=(",", ":")) if scope else None,
+                    round(total * 1000, 1) if total is not None else None,
+                    json.dumps(stages, separators=(",", ":")) if stages else None,
+                ),
+            )
+
+
+def compact(retention_days: float = RETENTION_DAYS, path: str = None, conn=None) -> int:
+    """Drop queries older than retention_days plus orphaned answers/sessions, then reclaim space."""
+    own = conn is None
+    conn = conn or connect(path)
+    try:
+        cutoff = time.time() - retention_days * 86400
+        with conn:
+            deleted = conn.execute("DELETE FROM queries WHERE ts < ?", (cutoff,)).rowcount
+            conn.execute("DELETE FROM answers WHERE id NOT IN "
+                         "(SELECT answer_id FROM queries WHERE answer_id IS NOT NULL)")
+            conn.execute("DELETE FROM sessions WHERE id NOT IN (SELECT session_id FROM queries)")
+        conn.execute("PRAGMA incremental_vacuum")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return deleted
+    finally:
+        if own:
+            conn.close()
+
+
+# -----------------------------
+# Reading
+# -----------------------------
+def _read(path: str = None):
+    path = path or DB_PATH
+    return connect(path) if os.path.exists(path) else None
+
+
+def load_chat(session_id: str, path: str = None) -> list:
+    """A session's questions and answers as app.py chat_history items."""
+    conn = _read(path)
+    if conn is None:
+        return []
+    try:
+        rows = conn.execute(
+            "SELECT q.question, a.text, q.sources FROM queries q LEFT JOIN answers a ON a.id = q.answer_id "
+            "WHERE q.session_id = ? ORDER BY q.ts, q.id",
+            (session_id,),
+        ).fetchall()
+    finally:
+        conn.close()
+    items = []
+    for question, answer, sources in rows:
+        items.append({"type": "question", "text": question})
+        if answer is not None:
+            items.append({"type": "answer", "text": answer})
+        sources = json.loads(sources) if sources else []
+        if sources and sources[0]:
+            items.append({"type": "source", "text": sources[0].split("/")[-1].split("\\")[-1]})
+    return items
+
+
+def top_questions(limit: int = 50, days: float = None, path: str = None) -> list:
+    """(question, times asked) for the most frequent questions, optionally within the last days."""
+    conn = _read(path)
+    if conn is None:
+        return []
+    cutoff = time.time() - days * 86400 if days else 0
+    try:
+        return conn.execute(
+            "SELECT question, COUNT(*) AS n FROM queries WHERE ts >= ? "
+            "GROUP BY question_key ORDER BY n DESC, MAX(ts) DESC LIMIT ?",
+            (cutoff, limit),
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and maintain the chat history / query log")
+    parser.add_argument("--db", default=DB_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    top_parser = subparsers.add_parser("top", help="Most frequently asked questions")
+    top_parser.add_argument("--limit", type=int, default=20)
+    top_parser.add_argument("--days", type=float, help="Only count the last N days")
+    compact_parser = subparsers.add_parser("compact", help="Apply retention and reclaim space")
+    compact_parser.add_argument("--days", type=float, default=RETENTION_DAYS, help="Keep the last N days")
+    args = parser.parse_args()
+
+    if args.command == "top":
+        for question, count in top_questions(args.limit, args.days, args.db):
+            print(f"{count:>6}  {question}")
+    else:
+        deleted = compact(args.days, args.db)
+        print(f"Removed {deleted} queries older than {args.days:g} days from {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# indexer.py
+"""
+Background indexing worker for uploaded PDFs.
+
+Uploads are queued and indexed one batch at a time by a daemon thread, so
+the Streamlit session that submitted them never blocks. Each batch (the
+files of one upload) is applied to one copy of the current snapshot, which
+is then published (like watch mode), so every app process and shard worker
+swaps to it.
+"""
+import os
+import queue
+import threading
+import time
+import uuid
+
+import ingest
+
+# -----------------------------
+# Config
+# -----------------------------
+MAX_JOBS_KEPT = 50  # finished jobs remembered for the status list
+
+_queue = queue.Queue()
+_jobs = {}          # job id -> job dict
+_lock = threading.Lock()
+_worker = None
+
+
+def upload_path(file_name: str, docs_dir: str = ingest.DOCS_DIR) -> str:
+    return os.path.join(docs_dir, os.path.basename(file_name))
+
+
+def save_upload(file_name: str, data: bytes, docs_dir: str = ingest.DOCS_DIR, replace: bool = False) -> str:
+    """
+    Write an uploaded PDF into docs_dir so full re-ingests include it too.
+
+    Raises FileExistsError if a document of that name exists, unless replace is set.
+    """
+    path = upload_path(file_name, docs_dir)
+    if not replace and os.path.exists(path):
+        raise FileExistsError(f"{os.path.basename(path)} already exists in {docs_dir}")
+    tmp_path = path + ".part"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return path
+
+
+def submit(paths) -> str:
+    """Queue PDFs for indexing into one new snapshot and return the job id."""
+    global _worker
+    paths = sorted(set(paths))
+    job_id = uuid.uuid4().hex[:8]
+    with _lock:
+        _jobs[job_id] = {
+            "id": job_id,
+            "file": ", ".join(os.path.basename(p) for p in paths),
+            "paths": paths,
+            "status": "queued",
+            "progress": 0.0,
+            "chunks": 0,
+            "error": None,
+            "submitted": time.time(),
+        }
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="rag-indexer", daemon=True)
+            _worker.start()
+    _queue.put(job_id)
+    return job_id
+
+
+def is_active(job: dict) -> bool:
+    return job["status"] in ("queued", "indexing")
+
+
+def jobs() -> list:
+    """Copies of all known jobs, newest first."""
+    with _lock:
+        return sorted((dict(job) for job in _jobs.values()), key=lambda j: j["submitted"], reverse=True)
+
+
+def _update(job_id: str, **fields):
+    with _lock:
+        _jobs[job_id].update(fields)
+
+
+def _prune():
+    with _lock:
+        finished = [j for j in _jobs.values() if j["status"] in ("done", "failed")]
+        finished.sort(key=lambda j: j["submitted"])
+        for job in finished[:max(0, len(finished) - MAX_JOBS_KEPT)]:
+            del _jobs[job["id"]]
+
+
+def _run():
+    # Imported here so importing indexer never loads the embedding model
+    import rag_pipeline
+
+    while True:
+        job_id = _queue.get()
+        paths = _jobs[job_id]["paths"]
+        try:
+            _update(job_id, status="indexing")
+            indexed_chunks = {}  # path -> chunks indexed so far
+
+            def progress(path, done, total, job_id=job_id):
+                # Files are indexed in sorted order, one after another
+                indexed_chunks[path] = done
+                position = paths.index(path) + (done / total if total else 1.0)
+                _update(job_id, progress=position / len(paths), chunks=sum(indexed_chunks.values()))
+
+            count = ingest.index_files(rag_pipeline.embedding, paths, progress)
+            rag_pipeline.refresh_index()  # serve it here without waiting for the next check
+            _update(job_id, status="done", progress=1.0, chunks=count)
+        except Exception as e:
+            _update(job_id, status="failed", error=str(e))
+        finally:
+            _queue.task_done()
+            _prune()
@@ -1,39 +1,402 @@
 # ingest.py
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain_community.document_loaders import PyPDFLoader
+from chunk_quality import annotate_chunks
+from token_splitter import TokenSentenceSplitter, by_length
+import dedup
+import embed_server
+import shards
+import snapshots
+import text_cache
+import argparse
+import json
 import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 # -----------------------------
 # Config
 # -----------------------------
 DOCS_DIR = "docs"  # Folder with PDF files
-DB_DIR = "db"      # Folder to store vectorstore
-
-# Initialize embeddings
-embedding = HuggingFaceEmbeddings(model_name="BAAI/bge-base-en")
-
-# Collect all PDF files
-all_docs = []
-for file_name in os.listdir(DOCS_DIR):
-    if file_name.endswith(".pdf"):
-        loader = PyPDFLoader(os.path.join(DOCS_DIR, file_name))
-        all_docs.extend(loader.load())
-
-# Split into chunks
-splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=100
-)
-chunks = splitter.split_documents(all_docs)
-
-# Create or load vectorstore
-vectorstore = Chroma.from_documents(
-    documents=chunks,
-    embedding=embedding,
-    persist_directory=DB_DIR
-)
-
-vectorstore.persist()
-print(f"Documents indexed successfully. Total chunks: {len(chunks)}")
+DB_DIR = "db"      # Folder to store vectorstore snapshots
+EMBEDDING_MODEL = "BAAI/bge-base-en"
+CHUNK_SIZE = 256     # Target tokens per chunk (bge-base embeds at most 510)
+CHUNK_OVERLAP = 32   # Tokens of trailing sentences repeated in the next chunk
+UPSERT_BATCH_SIZE = 32  # Chunks embedded per batch when indexing a single file
+MANIFEST_FILE = "manifest.json"  # Per-snapshot record of indexed PDFs
+NUM_SHARDS = 1          # >1 splits the index into shards built in parallel processes
+SHARD_BY = shards.SHARD_BY_DOCUMENT
+DEDUP = True            # Collapse near-duplicate chunks (see dedup.py)
+USE_TEXT_CACHE = True   # Reuse extracted page text of unchanged PDFs (see text_cache.py)
+
+# Watch mode
+WATCH_POLL_INTERVAL = 2.0  # seconds between scans of docs/
+WATCH_DEBOUNCE = 5.0       # wait until docs/ has been unchanged this long
+WATCH_BATCH_PAUSE = 0.5    # pause between embedding batches to leave CPU for queries
+WATCH_TORCH_THREADS = 1    # embedding threads used by the watcher
+
+
+def _parse_pdf(path: str):
+    return PyPDFLoader(path).load()
+
+
+def load_pdf(path: str):
+    """Load every page of one PDF, reusing cached text when the file is unchanged."""
+    if USE_TEXT_CACHE:
+        return text_cache.load_pages(path, _parse_pdf)
+    return _parse_pdf(path)
+
+
+def load_documents(docs_dir: str = DOCS_DIR):
+    """Load every page of every PDF in docs_dir."""
+    all_docs = []
+    for file_name in os.listdir(docs_dir):
+        if file_name.endswith(".pdf"):
+            all_docs.extend(load_pdf(os.path.join(docs_dir, file_name)))
+    return all_docs
+
+
+def split_documents(all_docs, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP):
+    """
+    Split pages into sentence-aligned chunks of at most chunk_size tokens,
+    score them and drop junk (TOC pages, number tables).
+
+    Returns:
+        chunks: list of chunks worth embedding
+        dropped: number of low-quality chunks removed
+    """
+    splitter = TokenSentenceSplitter(EMBEDDING_MODEL, chunk_size, chunk_overlap)
+    chunks = splitter.split_documents(all_docs)
+    kept = annotate_chunks(chunks)
+    return kept, len(chunks) - len(kept)
+
+
+def build_index(chunks, embedding, db_dir: str = DB_DIR):
+    """Embed chunks and persist them to a Chroma vectorstore in db_dir."""
+    vectorstore = Chroma.from_documents(
+        documents=by_length(chunks),
+        embedding=embedding,
+        persist_directory=db_dir
+    )
+    vectorstore.persist()
+    return vectorstore
+
+
+def get_embedding():
+    """The shared embedding server's client when it is running, else an in-process model."""
+    return embed_server.get_embedding(EMBEDDING_MODEL, lambda: HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL))
+
+
+def _build_shard(job) -> int:
+    """Process-pool worker: embed one shard (through the embedding server or its own model)."""
+    chunks, db_dir, threads = job
+    try:
+        import torch
+        torch.set_num_threads(threads)  # share the cores between shard processes
+    except ImportError:
+        pass
+    embedding = get_embedding()
+    if chunks:
+        build_index(chunks, embedding, db_dir)
+    else:
+        Chroma(persist_directory=db_dir, embedding_function=embedding).persist()
+    return len(chunks)
+
+
+def build_sharded_index(chunks, db_dir: str, num_shards: int, by: str = SHARD_BY) -> list:
+    """Partition chunks into num_shards Chroma directories, built in parallel processes."""
+    groups = shards.partition(chunks, num_shards, by)
+    threads = max(1, (os.cpu_count() or 1) // num_shards)
+    jobs = [(group, shards.shard_dir(db_dir, i), threads) for i, group in enumerate(groups)]
+    with ProcessPoolExecutor(max_workers=num_shards) as pool:
+        counts = list(pool.map(_build_shard, jobs))
+    shards.write_layout(db_dir, num_shards, by)
+    return counts
+
+
+def file_stat(path: str) -> list:
+    """Manifest entry of one PDF: [mtime_ns, size]."""
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def scan_docs(docs_dir: str = DOCS_DIR) -> dict:
+    """Map each PDF path in docs_dir to [mtime_ns, size]."""
+    found = {}
+    for entry in os.scandir(docs_dir):
+        if entry.is_file() and entry.name.endswith(".pdf"):
+            stat = entry.stat()
+            found[os.path.join(docs_dir, entry.name)] = [stat.st_mtime_ns, stat.st_size]
+    return found
+
+
+def read_manifest(snapshot_dir: str):
+    try:
+        with open(os.path.join(snapshot_dir, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_manifest(snapshot_dir: str, manifest: dict):
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def _retire_chunks(vectorstore, path: str, old) -> int:
+    """
+    Remove a file's chunks given the result of vectorstore.get().
+
+    Chunks that also stand for duplicates in other files are re-pointed at
+    one of those files instead of being deleted.
+    """
+    delete_ids, update_ids, update_metadatas = [], [], []
+    for chunk_id, metadata in zip(old["ids"], old["metadatas"]):
+        remaining = dedup.drop_source(metadata or {}, path)
+        if remaining is None:
+            delete_ids.append(chunk_id)
+        else:
+            update_ids.append(chunk_id)
+            update_metadatas.append(remaining)
+    if delete_ids:
+        vectorstore.delete(ids=delete_ids)
+    if update_ids:
+        shards.update_metadatas(vectorstore, update_ids, update_metadatas)
+    return len(delete_ids)
+
+
+def remove_file(vectorstore, path: str) -> int:
+    """Delete every chunk of one PDF from a live vectorstore."""
+    return _retire_chunks(vectorstore, path, vectorstore.get(where=dedup.source_filter([path])))
+
+
+def upsert_file(vectorstore, path: str, progress=None) -> int:
+    """
+    Incrementally (re)index one PDF in a live vectorstore.
+
+    New chunks are added before the file's old chunks are deleted, so the
+    document stays searchable throughout. Near-duplicates are collapsed
+    within the file.
+
+    Args:
+        progress: optional callback(done_chunks, total_chunks)
+
+    Returns:
+        number of chunks indexed
+    """
+    chunks, _ = split_documents(load_pdf(path))
+    if DEDUP:
+        chunks, _ = dedup.collapse(chunks)
+    chunks = by_length(chunks)
+    old = vectorstore.get(where=dedup.source_filter([path]))
+
+    for start in range(0, len(chunks), UPSERT_BATCH_SIZE):
+        vectorstore.add_documents(chunks[start:start + UPSERT_BATCH_SIZE])
+        if progress:
+            progress(min(start + UPSERT_BATCH_SIZE, len(chunks)), len(chunks))
+
+    _retire_chunks(vectorstore, path, old)
+    vectorstore.persist()
+    return len(chunks)
+
+
+def embedding_bytes(embedding) -> int:
+    """Bytes one stored float32 vector of this model takes."""
+    return len(embedding.embed_query("dimension probe")) * 4
+
+
+def rebuild(embedding, num_shards: int = NUM_SHARDS, shard_by: str = SHARD_BY):
+    """Index every PDF in DOCS_DIR into a new snapshot and publish it."""
+    # Held throughout, so an upload published meanwhile is not lost when this publishes
+    with snapshots.writer_lock(DB_DIR):
+        manifest = scan_docs(DOCS_DIR)
+        all_docs = load_documents(DOCS_DIR)
+        chunks, dropped = split_documents(all_docs)
+        duplicates = 0
+        if DEDUP:
+            chunks, duplicates = dedup.collapse(chunks)
+
+        # Build into a fresh snapshot so running pipelines keep serving the old one,
+        # then publish it atomically; they swap over between requests.
+        snapshot_dir = snapshots.new_snapshot_dir(DB_DIR)
+        start = time.perf_counter()
+        if num_shards > 1:
+            counts = build_sharded_index(chunks, snapshot_dir, num_shards, shard_by)
+        else:
+            build_index(chunks, embedding, snapshot_dir)
+        build_seconds = time.perf_counter() - start
+        write_manifest(snapshot_dir, manifest)
+        snapshots.write_catalog(snapshot_dir, snapshots.build_catalog(c.metadata for c in chunks))
+        version = snapshots.publish(DB_DIR, snapshot_dir)
+        removed = snapshots.collect_garbage(DB_DIR)
+
+        print(f"Documents indexed successfully. Total chunks: {len(chunks)} (dropped {dropped} low-quality chunks)")
+        if duplicates:
+            saved = duplicates / (len(chunks) + duplicates)
+            print(f"Collapsed {duplicates} near-duplicate chunks: {saved:.1%} fewer vectors "
+                  f"(~{duplicates * embedding_bytes(embedding) / 1024:.0f} KB of embeddings)")
+        print(f"Embedded in {build_seconds:.1f}s")
+        if num_shards > 1:
+            print(f"Shards ({shard_by}): " + ", ".join(str(c) for c in counts) + " chunks")
+        print(f"Published snapshot {version}; removed {len(removed)} old snapshot(s)")
+
+
+# -----------------------------
+# Watch mode
+# -----------------------------
+def _manifest_of(snapshot_dir: str, store) -> dict:
+    """Manifest of a snapshot; rebuilt from chunk sources for older indexes."""
+    manifest = read_manifest(snapshot_dir)
+    if manifest is not None:
+        return manifest
+    # No manifest: assume files already in the index are up to date as they are now
+    sources = {s for m in store.get(include=["metadatas"])["metadatas"] for s in dedup.member_sources(m or {})}
+    return {path: stat for path, stat in scan_docs(DOCS_DIR).items() if path in sources}
+
+
+def _indexed_manifest(embedding) -> dict:
+    """Manifest of the current snapshot."""
+    current_dir = snapshots.snapshot_path(DB_DIR, snapshots.current_version(DB_DIR))
+    manifest = read_manifest(current_dir)
+    if manifest is not None:
+        return manifest
+    store = shards.open_store(current_dir, embedding)
+    try:
+        return _manifest_of(current_dir, store)
+    finally:
+        shards.close_store(store)
+
+
+def apply_changes(embedding, changed: dict, removed=(), progress=None) -> tuple:
+    """
+    Apply only the given files' chunks to a copy of the current snapshot and
+    publish it. Published snapshots are never written to; readers in every
+    process swap to the new one between requests.
+
+    Args:
+        changed: {path: file_stat(path)} of PDFs to (re)index
+        removed: paths of PDFs to drop from the index
+        progress: optional callback(path, done_chunks, total_chunks); files are indexed in sorted order
+
+    Returns:
+        manifest of the new snapshot, number of chunks indexed
+    """
+    with snapshots.writer_lock(DB_DIR):
+        snapshot_dir = snapshots.clone_current(DB_DIR)
+        store = None
+        indexed = 0
+        try:
+            store = shards.open_store(snapshot_dir, embedding)
+            manifest = _manifest_of(snapshot_dir, store)
+            # Another writer (upload, watcher) may already have applied some of these
+            changed = {path: stat for path, stat in changed.items() if manifest.get(path) != stat}
+            removed = [path for path in removed if path in manifest]
+            if not changed and not removed:
+                shards.close_store(store)
+                store = None
+                shutil.rmtree(snapshot_dir, ignore_errors=True)
+                return manifest, 0
+            for path in sorted(removed):
+                count = remove_file(store, path)
+                manifest.pop(path, None)
+                print(f"  - {path}: removed {count} chunks")
+            for path in sorted(changed):
+                count = upsert_file(store, path, progress and (lambda done, total, path=path: progress(path, done, total)))
+                manifest[path] = changed[path]
+                indexed += count
+                print(f"  + {path}: indexed {count} chunks")
+            store.persist()
+            write_manifest(snapshot_dir, manifest)
+            snapshots.write_catalog(snapshot_dir, snapshots.build_catalog(store.get(include=["metadatas"])["metadatas"]))
+        except Exception:
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+            raise
+        finally:
+            # Readers open the published directory with their own client
+            if store is not None:
+                shards.close_store(store)
+
+        version = snapshots.publish(DB_DIR, snapshot_dir)
+    snapshots.collect_garbage(DB_DIR)
+    print(f"Published snapshot {version} ({len(changed)} changed, {len(removed)} removed)")
+    return manifest, indexed
+
+
+def index_files(embedding, paths, progress=None) -> int:
+    """(Re)index PDFs into one new published snapshot. Returns the number of chunks indexed."""
+    return apply_changes(embedding, {path: file_stat(path) for path in paths}, progress=progress)[1]
+
+
+def _lower_priority():
+    """Keep the watcher from competing with query latency on the same host."""
+    try:
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass  # not available on Windows
+    try:
+        import torch
+        torch.set_num_threads(WATCH_TORCH_THREADS)
+    except ImportError:
+        pass
+
+
+def watch(embedding, poll_interval: float = WATCH_POLL_INTERVAL, debounce: float = WATCH_DEBOUNCE):
+    """Keep the index in sync with DOCS_DIR until interrupted."""
+    _lower_priority()
+    indexed = _indexed_manifest(embedding)
+    seen, changed_at = indexed, None
+    print(f"Watching {DOCS_DIR}/ ({len(indexed)} PDFs indexed). Press Ctrl+C to stop.")
+
+    while True:
+        time.sleep(poll_interval)
+        current = scan_docs(DOCS_DIR)
+        if current != seen:
+            # Still changing: restart the debounce window
+            seen, changed_at = current, time.monotonic()
+            continue
+        if current == indexed or time.monotonic() - changed_at < debounce:
+            continue
+        changed = {path: stat for path, stat in current.items() if indexed.get(path) != stat}
+        removed = [path for path in indexed if path not in current]
+        try:
+            # Throttle: yield the CPU between embedding batches
+            indexed, _ = apply_changes(embedding, changed, removed,
+                                       progress=lambda *_: time.sleep(WATCH_BATCH_PAUSE))
+        except Exception as e:
+            print(f"Failed to apply changes, will retry: {e}")
+            changed_at = time.monotonic()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index the PDFs in docs/")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and apply added/changed/removed PDFs incrementally")
+    parser.add_argument("--poll", type=float, default=WATCH_POLL_INTERVAL, help="Seconds between scans")
+    parser.add_argument("--debounce", type=float, default=WATCH_DEBOUNCE,
+                        help="Seconds docs/ must stay unchanged before indexing")
+    parser.add_argument("--shards", type=int, default=NUM_SHARDS,
+                        help="Split the index into N shards built in parallel processes")
+    parser.add_argument("--shard-by", choices=[shards.SHARD_BY_DOCUMENT, shards.SHARD_BY_CHUNK], default=SHARD_BY)
+    parser.add_argument("--no-cache", action="store_true", help="Re-extract text from every PDF")
+    args = parser.parse_args()
+
+    global USE_TEXT_CACHE
+    if args.no_cache:
+        USE_TEXT_CACHE = False
+    else:
+        text_cache.prune()
+
+    embedding = get_embedding()
+    if args.watch:
+        try:
+            watch(embedding, args.poll, args.debounce)
+        except KeyboardInterrupt:
+            print("Watcher stopped.")
+    else:
+        rebuild(embedding, args.shards, args.shard_by)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+# loadtest.py
+"""
+Offline load test: simulated chat users driving ask_question in-process.
+
+Questions arrive as a Poisson process at each offered rate and are served
+by a pool of `concurrency` workers, like Streamlit sessions sharing one
+process. Latency is measured from arrival, so queueing shows up once the
+instance saturates. For each step it reports the achieved throughput,
+latency percentiles, queue wait, error rate, CPU and memory use, and the
+run stops at the first saturated step.
+
+The answer and query-embedding caches are off by default: a small mix of
+repeated questions would otherwise be served from memory after the first
+pass and the curve would not measure the pipeline. --caches measures a
+cached deployment instead (caches pre-warmed with the mix unless --cold).
+
+Run from this folder:
+    python loadtest.py                                   # rates 1,2,4,8,16 req/s, 8 workers
+    python loadtest.py --rates 2,4,8 --concurrency 4,16 --duration 60
+    python loadtest.py --mix questions.jsonl             # {"question", "weight", "documents", "pages"}
+    python loadtest.py --from-log 100                    # most frequent logged questions, by frequency
+    python loadtest.py --caches                          # with caches, pre-warmed
+    python loadtest.py --compare loadtest_results/old.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from benchmark import DEFAULT_TOLERANCE, QUESTIONS, peak_rss_mb, summarize
+
+# -----------------------------
+# Config
+# -----------------------------
+RESULTS_DIR = "loadtest_results"
+DEFAULT_RATES = [1, 2, 4, 8, 16]  # offered requests per second
+DEFAULT_CONCURRENCY = [8]
+STEP_SECONDS = 30.0
+DRAIN_TIMEOUT = 30.0     # seconds to finish the backlog after arrivals stop
+SATURATION = 0.9         # achieved / offered below this counts as saturated
+MAX_ERROR_RATE = 0.01
+SEED = 7
+
+
+# -----------------------------
+# Question mix
+# -----------------------------
+def load_mix(path: str) -> list:
+    """Weighted question mix from JSONL ({"question", "weight", "documents", "pages"}) or plain text lines."""
+    mix = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            item = json.loads(line) if line.startswith("{") else {"question": line}
+            item.setdefault("weight", 1.0)
+            mix.append(item)
+    return mix
+
+
+def mix_from_log(limit: int) -> list:
+    import history
+    return [{"question": q, "weight": count} for q, count in history.top_questions(limit)]
+
+
+def current_rss_mb():
+    """Resident set size right now in MB (None where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+# -----------------------------
+# Load generation
+# -----------------------------
+def run_step(ask_question, mix, rate: float, concurrency: int, duration: float, rng) -> dict:
+    """Offer rate requests/s for duration seconds to concurrency workers."""
+    weights = [item["weight"] for item in mix]
+    lock = threading.Lock()
+    latencies, waits, errors = [], [], Counter()
+
+    def handle(item, arrived):
+        started = time.perf_counter()
+        try:
+            pages = item.get("pages")
+            ask_question(item["question"], documents=item.get("documents"),
+                         page_range=tuple(pages) if pages else None)
+        except Exception as e:
+            with lock:
+                errors[type(e).__name__] += 1
+            return
+        finished = time.perf_counter()
+        with lock:
+            waits.append(started - arrived)
+            latencies.append(finished - arrived)
+
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="loadtest-user")
+    futures = []
+    cpu_start = time.process_time()
+    start = next_arrival = time.perf_counter()
+    while True:
+        next_arrival += rng.expovariate(rate)
+        if next_arrival - start >= duration:
+            break
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        item = rng.choices(mix, weights)[0]
+        futures.append(pool.submit(handle, item, next_arrival))
+
+    # Let the backlog drain, but give up on requests that never started
+    _, pending = wait(futures, timeout=DRAIN_TIMEOUT)
+    dropped = sum(1 for f in pending if f.cancel())
+    pool.shutdown(wait=True)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    requests = len(futures)
+    failed = sum(errors.values()) + dropped
+    if dropped:
+        errors["Dropped"] += dropped
+    return {
+        "rate": rate,
+        "concurrency": concurrency,
+        "requests": requests,
+        "offered_rps": round(requests / duration, 3),
+        "completed": len(latencies),
+        "achieved_rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "error_rate": round(failed / requests, 4) if requests else 0.0,
+        "errors": dict(errors),
+        "latency": summarize(latencies),
+        "queue_wait": summarize(waits),
+        "cpu_percent": round(cpu / elapsed * 100, 1) if elapsed else 0.0,
+        "rss_mb": current_rss_mb(),
+        "threads": threading.active_count(),
+    }
+
+
+def saturated(step: dict, slo_p95_ms: float = None) -> bool:
+    if step["error_rate"] > MAX_ERROR_RATE:
+        return True
+    # The backlog made the step run past its duration: arrivals outpaced service
+    if step["achieved_rps"] < step["offered_rps"] * SATURATION:
+        return True
+    return bool(slo_p95_ms) and step["latency"]["p95_ms"] > slo_p95_ms
+
+
+def run_curve(ask_question, mix, rates, concurrency_levels, duration: float, slo_p95_ms: float = None) -> list:
+    """Step through the offered rates for each concurrency level, stopping at saturation."""
+    rng = random.Random(SEED)
+    steps = []
+    for concurrency in concurrency_levels:
+        for rate in rates:
+            print(f"  concurrency {concurrency}, {rate:g} req/s for {duration:g}s...")
+            step = run_step(ask_question, mix, rate, concurrency, duration, rng)
+            step["saturated"] = saturated(step, slo_p95_ms)
+            steps.append(step)
+            print(f"    {step['achieved_rps']:.2f} req/s  p50 {step['latency']['p50_ms']:.1f}ms  "
+                  f"p95 {step['latency']['p95_ms']:.1f}ms  errors {step['error_rate']:.1%}  "
+                  f"cpu {step['cpu_percent']:.0f}%" + ("  SATURATED" if step["saturated"] else ""))
+            if step["saturated"]:
+                break
+    return steps
+
+
+def max_sustainable(steps) -> dict:
+    """Highest offered rate handled without saturation, per concurrency level."""
+    best = {}
+    for step in steps:
+        if not step["saturated"]:
+            key = str(step["concurrency"])
+            best[key] = max(best.get(key, 0), step["rate"])
+    return best
+
+
+# -----------------------------
+# Regression check
+# -----------------------------
+def compare(current: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> list:
+    """Return human-readable scaling regressions of current vs baseline."""
+    regressions = []
+    if current.get("caches") != baseline.get("caches"):
+        return [f"caches {'on' if current.get('caches') else 'off'} here but "
+                f"{'on' if baseline.get('caches') else 'off'} in the baseline; runs are not comparable"]
+    old_steps = {(s["concurrency"], s["rate"]): s for s in baseline.get("steps", [])}
+    for step in current.get("steps", []):
+        old = old_steps.get((step["concurrency"], step["rate"]))
+        if not old:
+            continue
+        name = f"concurrency {step['concurrency']} @ {step['rate']:g} req/s"
+        if old["latency"]["p95_ms"] and step["latency"]["p95_ms"] > old["latency"]["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {old['latency']['p95_ms']}ms -> {step['latency']['p95_ms']}ms")
+        if step["error_rate"] > old["error_rate"] + MAX_ERROR_RATE:
+            regressions.append(f"{name}: error rate {old['error_rate']:.1%} -> {step['error_rate']:.1%}")
+    for concurrency, rate in baseline.get("max_sustainable_rps", {}).items():
+        new_rate = current.get("max_sustainable_rps", {}).get(concurrency, 0)
+        if new_rate < rate:
+            regressions.append(f"concurrency {concurrency}: sustainable rate {rate:g} -> {new_rate:g} req/s")
+    return regressions
+
+
+def _numbers(value: str, cast=float) -> list:
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the RAG pipeline with simulated concurrent users")
+    parser.add_argument("--rates", default=",".join(map(str, DEFAULT_RATES)), help="Offered requests/s per step")
+    parser.add_argument("--concurrency", default=",".join(map(str, DEFAULT_CONCURRENCY)),
+                        help="Worker counts (simultaneous requests in flight)")
+    parser.add_argument("--duration", type=float, default=STEP_SECONDS, help="Seconds per step")
+    parser.add_argument("--mix", help="Question mix file (JSONL or one question per line)")
+    parser.add_argument("--from-log", type=int, metavar="N", help="Use the N most frequent logged questions")
+    parser.add_argument("--slo", type=float, help="p95 latency in ms above which a step counts as saturated")
+    parser.add_argument("--caches", action="store_true",
+                        help="Keep the answer and query-embedding caches on (off by default)")
+    parser.add_argument("--cold", action="store_true", help="With --caches, skip pre-warming them with the mix")
+    parser.add_argument("--output", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Baseline JSON to check for scaling regressions")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    # Fully offline: models must already be in the local Hugging Face cache
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+    if args.mix:
+        mix = load_mix(args.mix)
+    elif args.from_log:
+        mix = mix_from_log(args.from_log)
+    else:
+        mix = [{"question": q, "weight": 1.0} for q in QUESTIONS]
+    if not mix:
+        sys.exit("Empty question mix.")
+
+    print("Loading pipeline...")
+    import rag_pipeline
+    import warmup
+    if not args.caches:
+        # Measure the pipeline, not lookups of the mix's questions in memory
+        rag_pipeline.answer_cache.maxsize = 0
+        rag_pipeline.embedding.cache.maxsize = 0
+    if args.caches and not args.cold:
+        warmup.warm([item["question"] for item in mix], budget=warmup.BUDGET_SECONDS)
+    else:
+        rag_pipeline.ask_question(mix[0]["question"])  # load the index, not measured
+
+    rates, levels = _numbers(args.rates), _numbers(args.concurrency, int)
+    print(f"Load testing {len(mix)} questions, rates {rates} req/s, concurrency {levels}...")
+    steps = run_curve(rag_pipeline.ask_question, mix, rates, levels, args.duration, args.slo)
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "cpus": os.cpu_count(),
+        "questions": len(mix),
+        "duration_s": args.duration,
+        "caches": args.caches,
+        "steps": steps,
+        "max_sustainable_rps": max_sustainable(steps),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    print("  workers  offered  achieved     p50 ms     p95 ms     p99 ms  errors    cpu")
+    for step in steps:
+        print(f"  {step['concurrency']:>7}  {step['rate']:>7g}  {step['achieved_rps']:>8.2f}  "
+              f"{step['latency']['p50_ms']:>9.1f}  {step['latency']['p95_ms']:>9.1f}  "
+              f"{step['latency']['p99_ms']:>9.1f}  {step['error_rate']:>6.1%}  {step['cpu_percent']:>4.0f}%")
+    for concurrency, rate in results["max_sustainable_rps"].items():
+        print(f"  max sustainable with {concurrency} workers: {rate:g} req/s")
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions vs baseline:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("No regressions vs baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# metrics.py
+"""
+Lightweight per-stage tracing and counters for the RAG pipeline.
+
+Disabled by default; turn on with RAG_METRICS=1 or metrics.enable() at
+runtime. When disabled every call returns immediately.
+
+    import metrics
+    metrics.enable(jsonl_path="logs/traces.jsonl")
+    ...
+    print(metrics.export_prometheus())
+"""
+import bisect
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# -----------------------------
+# Config
+# -----------------------------
+PREFIX = "rag"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = os.getenv("RAG_METRICS", "0").lower() in ("1", "true", "yes")
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> float
+_histograms = {}  # stage -> [bucket counts..., +Inf count, sum]
+_jsonl_file = None
+
+
+def enable(jsonl_path: str = None):
+    """Turn metrics on, optionally appending one JSON line per request to jsonl_path."""
+    global _enabled, _jsonl_file
+    with _lock:
+        if jsonl_path:
+            if _jsonl_file is not None:
+                _jsonl_file.close()
+            os.makedirs(os.path.dirname(jsonl_path) or ".", exist_ok=True)
+            _jsonl_file = open(jsonl_path, "a", encoding="utf-8", buffering=1)
+        _enabled = True
+
+
+def disable():
+    """Turn metrics off and close the JSONL sink. Collected values are kept."""
+    global _enabled, _jsonl_file
+    with _lock:
+        _enabled = False
+        if _jsonl_file is not None:
+            _jsonl_file.close()
+            _jsonl_file = None
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    """Forget all collected counters and histograms."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def question_hash(question: str) -> str:
+    """Short stable id for a question, so logs don't carry the raw text."""
+    return hashlib.sha1(question.encode("utf-8")).hexdigest()[:12]
+
+
+# -----------------------------
+# Recording
+# -----------------------------
+def increment(name: str, amount: float = 1, **labels):
+    """Add amount to a counter, e.g. increment("retrieval_fallback_total", to="similarity_search")."""
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(stage: str, seconds: float):
+    """Record one stage duration in the stage histogram."""
+    if not _enabled:
+        return
+    with _lock:
+        _observe_locked(stage, seconds)
+
+
+def _observe_locked(stage: str, seconds: float):
+    hist = _histograms.get(stage)
+    if hist is None:
+        hist = _histograms[stage] = [0] * (len(BUCKETS) + 2)
+    hist[bisect.bisect_left(BUCKETS, seconds)] += 1
+    hist[-1] += seconds
+
+
+def record_trace(question: str, timings: dict, **fields):
+    """Record all stage timings of one request and write it to the JSONL sink."""
+    if not _enabled:
+        return
+    with _lock:
+        for stage, seconds in timings.items():
+            _observe_locked(stage, seconds)
+        if _jsonl_file is not None:
+            record = {
+                "ts": round(time.time(), 3),
+                "question_hash": question_hash(question),
+                "spans_ms": {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()},
+            }
+            record.update(fields)
+            _jsonl_file.write(json.dumps(record) + "\n")
+
+
+# -----------------------------
+# Export
+# -----------------------------
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def export_prometheus() -> str:
+    """Render all metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((stage, list(hist)) for stage, hist in _histograms.items())
+
+    seen = set()
+    for (name, labels), value in counters:
+        full_name = f"{PREFIX}_{name}"
+        if full_name not in seen:
+            lines.append(f"# TYPE {full_name} counter")
+            seen.add(full_name)
+        lines.append(f"{full_name}{_format_labels(labels)} {value:g}")
+
+    if histograms:
+        full_name = f"{PREFIX}_stage_seconds"
+        lines.append(f"# TYPE {full_name} histogram")
+        for stage, hist in histograms:
+            cumulative = 0
+            for bound, count in zip(BUCKETS, hist):
+                cumulative += count
+                lines.append(f'{full_name}_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+            cumulative += hist[len(BUCKETS)]
+            lines.append(f'{full_name}_bucket{{stage="{stage}",le="+Inf"}} {cumulative}')
+            lines.append(f'{full_name}_sum{{stage="{stage}"}} {hist[-1]:.6f}')
+            lines.append(f'{full_name}_count{{stage="{stage}"}} {cumulative}')
+
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = export_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_http_server(port: int = 9108, host: str = "127.0.0.1"):
+    """Serve /metrics for Prometheus scraping from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
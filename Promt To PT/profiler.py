@@ -0,0 +1,150 @@
+# profiler.py
+"""
+Opt-in sampling profiler for slow ask_question calls.
+
+While enabled, a background thread samples the stacks of threads that are
+inside ask_question. When a call takes longer than the threshold, its
+samples are written as a collapsed-stack file (flamegraph.pl / speedscope
+"folded" format) next to a JSON file with the question hash, retrieved
+chunk ids and stage timings. Dumps are rate limited so the mode is safe
+to leave on.
+
+Enable with RAG_PROFILE=1 (threshold: RAG_PROFILE_THRESHOLD seconds) or
+profiler.enable(threshold=...).
+"""
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+import metrics
+
+# -----------------------------
+# Config
+# -----------------------------
+PROFILE_DIR = "profiles"
+SAMPLE_INTERVAL = 0.005       # seconds between stack samples
+MAX_PROFILES_PER_WINDOW = 5   # rate limit: dumps allowed per window
+RATE_WINDOW = 3600.0          # seconds
+MAX_STACK_DEPTH = 128
+
+_enabled = os.getenv("RAG_PROFILE", "0").lower() in ("1", "true", "yes")
+_threshold = float(os.getenv("RAG_PROFILE_THRESHOLD", "2.0"))
+_lock = threading.Lock()
+_watched = {}                 # thread id -> Counter of folded stacks
+_wakeup = threading.Event()
+_sampler = None
+_dump_times = collections.deque()
+
+
+def enable(threshold: float = None, profile_dir: str = None):
+    """Start profiling calls slower than threshold seconds."""
+    global _enabled, _threshold, PROFILE_DIR
+    if threshold is not None:
+        _threshold = threshold
+    if profile_dir is not None:
+        PROFILE_DIR = profile_dir
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+# -----------------------------
+# Sampling
+# -----------------------------
+def _fold(frame) -> str:
+    """Collapse a frame chain into "root;...;leaf"."""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+
+def _sample_loop():
+    while True:
+        _wakeup.wait()
+        with _lock:
+            if not _watched:
+                _wakeup.clear()
+                continue
+            frames = sys._current_frames()
+            for thread_id, stacks in _watched.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    stacks[_fold(frame)] += 1
+        time.sleep(SAMPLE_INTERVAL)
+
+
+def start():
+    """Begin sampling the calling thread. Returns a token for stop(), or None when disabled."""
+    global _sampler
+    if not _enabled:
+        return None
+    thread_id = threading.get_ident()
+    with _lock:
+        _watched[thread_id] = collections.Counter()
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_loop, name="rag-profiler", daemon=True)
+            _sampler.start()
+    _wakeup.set()
+    return thread_id
+
+
+def _allow_dump() -> bool:
+    """Sliding-window rate limit on written profiles."""
+    now = time.monotonic()
+    while _dump_times and now - _dump_times[0] > RATE_WINDOW:
+        _dump_times.popleft()
+    if len(_dump_times) >= MAX_PROFILES_PER_WINDOW:
+        return False
+    _dump_times.append(now)
+    return True
+
+
+def stop(token, question: str, elapsed: float, chunk_ids=None, timings=None):
+    """
+    Stop sampling the calling thread and write a profile if the call was slow.
+
+    Returns:
+        path of the written .folded file, or None
+    """
+    if token is None:
+        return None
+    with _lock:
+        stacks = _watched.pop(token, None)
+        if not stacks or elapsed < _threshold:
+            return None
+        if not _allow_dump():
+            metrics.increment("slow_query_profile_dropped_total")
+            return None
+
+    qhash = metrics.question_hash(question)
+    base = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{qhash}")
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(base + ".folded", "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump({
+            "question_hash": qhash,
+            "elapsed_ms": round(elapsed * 1000, 3),
+            "threshold_ms": round(_threshold * 1000, 3),
+            "samples": sum(stacks.values()),
+            "sample_interval_ms": SAMPLE_INTERVAL * 1000,
+            "chunk_ids": list(chunk_ids or []),
+            "timings_ms": {k: round(v * 1000, 3) for k, v in (timings or {}).items()},
+        }, f, indent=2)
+    metrics.increment("slow_query_profile_total")
+    return base + ".folded"
@@ -1,44 +1,194 @@
 # rag_pipeline.py
 import os
 import re
+import time
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-from langchain_community.vectorstores import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
 import numpy as np
 from prompts import SYSTEM_PROMPT
+import caches
+import embed_server
+import metrics
+import shards
+import snapshots
+import profiler
+from chunk_quality import MIN_QUALITY, chunk_quality, chunk_sentences
 
 DB_DIR = "db"
+EMBEDDING_MODEL = "BAAI/bge-base-en"
+TOP_K = 4                    # Chunks retrieved per question
+SIMILARITY_THRESHOLD = 0.45  # Minimum question/sentence similarity for a key point
+QUERY_EMBEDDING_CACHE_SIZE = 4096
+ANSWER_CACHE_SIZE = 1024
 
-# Initialize embeddings & vectorstore
-embedding = HuggingFaceEmbeddings(model_name="BAAI/bge-base-en")
-vectorstore = Chroma(persist_directory=DB_DIR, embedding_function=embedding)
+# Initialize embeddings (shared embedding server when running, else in-process)
+embedding = caches.CachedQueryEmbeddings(
+    embed_server.get_embedding(EMBEDDING_MODEL, lambda: HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)),
+    QUERY_EMBEDDING_CACHE_SIZE,
+)
 
-# Create retriever
-retriever = vectorstore.as_retriever(search_kwargs={"k": 4})
+# Answers are keyed by snapshot version, so a newly published index never serves stale ones
+answer_cache = caches.LRUCache("answer", ANSWER_CACHE_SIZE)
+
+
+_index = None
+
+
+def _open_store(path: str):
+    """Open one snapshot as a (vectorstore, retriever, catalog) tuple."""
+    store = shards.open_store(path, embedding, TOP_K)
+    catalog = snapshots.read_catalog(path)
+    if isinstance(store, shards.ShardedStore):
+        return store, store, catalog  # scatter-gather over every shard, merged top-k
+    return store, store.as_retriever(search_kwargs={"k": TOP_K}), catalog
+
+
+def load_vectorstore(db_dir: str = DB_DIR, k: int = None):
+    """
+    (Re)open the index at db_dir, reusing the loaded embedding model.
+
+    Newly published snapshots of db_dir are picked up between requests
+    without calling this again.
+    """
+    global _index, TOP_K
+    if k is not None:
+        TOP_K = k
+    if _index is not None:
+        _index.close()
+    answer_cache.clear()
+    _index = snapshots.IndexHandle(db_dir, _open_store, lambda opened: shards.close_store(opened[0]))
+    return get_vectorstore()
+
+
+def refresh_index():
+    """Swap to a just-published snapshot now rather than at the next periodic check."""
+    _index.refresh(force=True)
+
+
+def get_vectorstore():
+    """Vectorstore of the snapshot currently served."""
+    return _index.store[0]
+
+
+def get_catalog():
+    """{source: {"pages", "chunks"}} of the snapshot currently served (None for older indexes)."""
+    return _index.store[2]
+
+
+# Initialize vectorstore & retriever
+load_vectorstore(DB_DIR)
 
 # -----------------------------
-def ask_question(question: str):
+def _mark(timings, stage: str, start: float) -> float:
+    """Add the time since start to timings[stage] and return the current time."""
+    now = time.perf_counter()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + (now - start)
+    return now
+
+
+def ask_question(question: str, timings: dict = None, documents=None, page_range=None):
     """
     Ask a question using RAG retrieval.
 
+    Args:
+        question: user question
+        timings: optional dict filled with seconds spent per stage
+            ("embed", "retrieve", "filter", "sentence-embed", "format", "total");
+            "embed" is the question embedding, "retrieve" the vector search
+        documents: optional source paths to search in (see shards.build_filter)
+        page_range: optional (first, last) 1-based page range to search in
+
     Returns:
         response_text: str
         sources: list of document sources
     """
-    # Retrieve relevant documents
+    if timings is None and (metrics.is_enabled() or profiler.is_enabled()):
+        timings = {}
+
+    token = profiler.start()
+    chunk_ids = [] if token is not None else None
+    start = time.perf_counter()
+    version, store = _index.acquire()
+    try:
+        key = (version, question.strip(), tuple(sorted(documents or ())), tuple(page_range or ()),
+               TOP_K, SIMILARITY_THRESHOLD)
+        cached = answer_cache.get(key)
+        if cached is not None:
+            return cached[0], list(cached[1])
+        where = shards.build_filter(documents, page_range)
+        answer, sources = _answer_question(question, store, where, timings, chunk_ids)
+        answer_cache.put(key, (answer, tuple(sources)))
+        return answer, sources
+    finally:
+        _index.release(version)
+        elapsed = time.perf_counter() - start
+        if timings is not None:
+            timings["total"] = elapsed
+            metrics.record_trace(question, timings)
+        profiler.stop(token, question, elapsed, chunk_ids, timings)
+
+
+def _chunk_id(doc) -> str:
+    """Stable identifier of a retrieved chunk for logs and profiles."""
+    doc_id = getattr(doc, "id", None)
+    if doc_id:
+        return str(doc_id)
+    meta = doc.metadata if isinstance(doc.metadata, dict) else {}
+    return f"{meta.get('source', 'Unknown')}:{meta.get('page', '?')}"
+
+
+def _retrieve(question: str, question_emb, store, where=None):
+    """Retrieve top chunks by the question's embedding, falling back through older retriever APIs."""
+    vectorstore, retriever, catalog = store
+    if where is not None:
+        # Scoped query: Chroma applies the metadata filter inside the ANN search
+        sources = shards.filter_sources(where)
+        # Skip the search only for documents that exist neither in the index nor on disk;
+        # a file on disk may be in a snapshot published since this one was opened
+        if catalog is not None and sources is not None and \
+                not any(s in catalog or os.path.exists(s) for s in sources):
+            metrics.increment("scoped_query_total", result="unknown_document")
+            return []
+        metrics.increment("scoped_query_total", result="searched")
+        return vectorstore.similarity_search_by_vector(question_emb, k=TOP_K, filter=where)
+    if isinstance(vectorstore, shards.ShardedStore):
+        # Implements the vector search itself: retrying through the fallbacks would only repeat the fan-out
+        return vectorstore.similarity_search_by_vector(question_emb, k=TOP_K)
     try:
-        docs_list = retriever.invoke(question)
-    except:
-        try:
-            docs_list = retriever.get_relevant_documents(question)
-        except:
-            docs_list = vectorstore.similarity_search(question, k=4)
+        return vectorstore.similarity_search_by_vector(question_emb, k=TOP_K)
+    except Exception:
+        metrics.increment("retrieval_fallback_total", to="invoke")
+    try:
+        return retriever.invoke(question)
+    except Exception:
+        metrics.increment("retrieval_fallback_total", to="get_relevant_documents")
+    try:
+        return retriever.get_relevant_documents(question)
+    except Exception:
+        metrics.increment("retrieval_fallback_total", to="similarity_search")
+    return vectorstore.similarity_search(question, k=TOP_K)
+
+
+def _answer_question(question: str, store, where, timings, chunk_ids):
+    t = time.perf_counter()
+
+    # Embed the question once; retrieval and sentence scoring share the vector
+    question_emb = embedding.embed_query(question)
+    t = _mark(timings, "embed", t)
+
+    # Retrieve relevant documents
+    docs_list = _retrieve(question, question_emb, store, where)
+    if chunk_ids is not None:
+        chunk_ids.extend(_chunk_id(d) for d in docs_list)
+    t = _mark(timings, "retrieve", t)
     
     if len(docs_list) == 0:
+        metrics.increment("no_answer_total", reason="no_documents")
         return "Information not available in provided documents.", []
 
     # Relevance check: verify that question keywords appear in the results
@@ -60,64 +210,33 @@ def ask_question(question: str):
     
     # If no keywords match, information not available
     if not found_match and len(question_words) > 0:
+        metrics.increment("no_answer_total", reason="no_keyword_match")
         return "Information not available in provided documents.", []
 
-    # Filter and clean retrieved chunks
-    valid_chunks = []
-    for d in docs_list:
-        content = d.page_content.strip()
-        
-        # Skip chunks that are mostly numbers, symbols, or very short
-        word_count = len(content.split())
-        if word_count < 20:  # Minimum 20 words
-            continue
-        
-        # Skip chunks that are mostly formatting characters
-        symbol_ratio = sum(1 for c in content if not c.isalnum() and c != ' ' and c != '.') / len(content)
-        if symbol_ratio > 0.3:  # More than 30% symbols
-            continue
-        
-        valid_chunks.append(content)
+    # Filter retrieved chunks using the quality score computed at ingest
+    valid_chunks = [d for d in docs_list if chunk_quality(d) >= MIN_QUALITY]
     
     if not valid_chunks:
         # Fallback: return first chunk if no valid ones found
-        valid_chunks = [d.page_content for d in docs_list if len(d.page_content) > 50]
+        valid_chunks = [d for d in docs_list if len(d.page_content) > 50]
     
     if not valid_chunks:
         return "Information not available in provided documents.", []
     
     # Extract and format key points from the best chunk
-    primary_context = valid_chunks[0]
-    
-    # Clean up Q&A format: remove "What is X? Answer:" patterns
-    text = primary_context
-    # Remove Q&A patterns like "What is X? Answer: content"
-    text = re.sub(r'[Ww]hat\s+is\s+[^?]*\?\s*[Aa]nswer:\s*', '', text)
-    text = re.sub(r'[Qq]uestion:\s*[^?]*\?\s*[Aa]nswer:\s*', '', text)
-    # Also handle plain "Answer: X" patterns
-    text = re.sub(r'[Aa]nswer:\s+', '', text)
+    primary_doc = valid_chunks[0]
+    primary_context = primary_doc.page_content.strip()
     
-    # Split by sentence delimiters
-    sentences = [s.strip() for s in re.split(r'[\.\n]+', text) if s.strip()]
-
-    # Basic candidate filtering (length, not labels, not examples)
-    candidates = []
-    for sentence in sentences:
-        if len(sentence) < 15 or len(sentence) > 350:
-            continue
-        if sentence[0].isdigit() or sentence.isupper() or ':' in sentence[:50]:
-            continue
-        if sentence.lower().startswith(('examples', 'e.g.', 'for example')):
-            continue
-        candidates.append(sentence)
+    # Sentences were cleaned and filtered at ingest time
+    candidates = chunk_sentences(primary_doc)
 
     # If no candidates, fallback to using raw primary_context split
     if not candidates:
         candidates = [s.strip() for s in primary_context.replace('\n', ' ').split('.') if len(s.strip()) > 30]
+    t = _mark(timings, "filter", t)
 
     # Compute embeddings and score sentences by semantic similarity to the question
     try:
-        question_emb = embedding.embed_documents([question])[0]
         sent_embs = embedding.embed_documents(candidates)
         qarr = np.array(question_emb)
         sims = []
@@ -131,12 +250,13 @@ def ask_question(question: str):
         # Select top sentences by similarity (threshold + top-k)
         ranked = sorted(zip(candidates, sims), key=lambda x: x[1], reverse=True)
         # prefer those above a reasonable threshold, otherwise top 4
-        selected = [s for s,score in ranked if score >= 0.45]
+        selected = [s for s,score in ranked if score >= SIMILARITY_THRESHOLD]
         if not selected:
             selected = [s for s,score in ranked][:4]
 
         key_points = selected
     except Exception:
+        metrics.increment("sentence_embed_fallback_total")
         # If embeddings fail for any reason, fallback to simple keyword/topic filtering
         q_words = [w for w in re.findall(r"\w+", question.lower()) if w not in stop_words and len(w) > 2]
         topic_word = sorted(q_words, key=len, reverse=True)[0] if q_words else None
@@ -147,6 +267,7 @@ def ask_question(question: str):
             keyword_matches = sum(1 for w in q_words if w in sent_low)
             if has_topic or keyword_matches > 0:
                 key_points.append(sentence)
+    t = _mark(timings, "sentence-embed", t)
     
     # Remove duplicates while preserving order
     seen = set()
@@ -191,5 +312,6 @@ def ask_question(question: str):
     
     # Return as list for compatibility
     sources = [source] if source else []
+    _mark(timings, "format", t)
 
     return response_text, sources
@@ -0,0 +1,31 @@
+# run_app.py
+"""
+Start the Streamlit app with cache warm-up begun at process start.
+
+`streamlit run app.py` only executes app.py once a browser session
+connects, so warm-up started there waits for the first visitor (who then
+waits for it) and RAG_READY_FILE never appears on an idle instance. This
+launcher starts warm-up in a background thread first and then runs the
+Streamlit server in the same process, so app sessions use the caches it
+fills:
+
+    python run_app.py                        # instead of streamlit run app.py
+    python run_app.py --server.port 8502     # any streamlit run options
+"""
+import os
+import sys
+
+from streamlit.web import cli as stcli
+
+import warmup
+
+
+def main():
+    warmup.start_in_background()
+    app = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    sys.argv = ["streamlit", "run", app] + sys.argv[1:]
+    sys.exit(stcli.main())
+
+
+if __name__ == "__main__":
+    main()
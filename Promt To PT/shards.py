@@ -0,0 +1,364 @@
+# shards.py
+"""
+Sharded vectorstore with parallel scatter-gather search.
+
+A sharded snapshot holds shards.json plus one Chroma directory per shard
+(shard-00/, shard-01/, ...). ShardedStore embeds the question once,
+searches every shard concurrently from a thread pool and merges the
+top-k by distance. Shards can also be served by separate local worker
+processes:
+
+    python shards.py serve --shard 0 --port 8601
+    python shards.py serve --shard 1 --port 8602
+    RAG_SHARD_URLS=http://127.0.0.1:8601,http://127.0.0.1:8602 python run_app.py
+
+Workers only hold their shard (no embedding model) and follow newly
+published snapshots like the app does.
+"""
+import argparse
+import json
+import os
+import urllib.request
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+
+import dedup
+import metrics
+import snapshots
+
+# -----------------------------
+# Config
+# -----------------------------
+LAYOUT_FILE = "shards.json"
+SHARD_BY_DOCUMENT = "document"  # all chunks of a PDF in one shard
+SHARD_BY_CHUNK = "chunk"        # chunks spread by content hash
+SHARED_SHARD = 0                # document sharding: chunks standing for several documents
+REMOTE_TIMEOUT = 10.0           # seconds per shard worker request
+
+
+def shard_dir(snapshot_dir: str, shard: int) -> str:
+    return os.path.join(snapshot_dir, f"shard-{shard:02d}")
+
+
+def shard_of(doc, count: int, by: str = SHARD_BY_DOCUMENT) -> int:
+    if by == SHARD_BY_DOCUMENT and len(dedup.member_sources(doc.metadata)) > 1:
+        return SHARED_SHARD  # searched for every document filter, see ShardedStore._searchers_for
+    key = doc.metadata.get("source", "") if by == SHARD_BY_DOCUMENT else doc.page_content
+    return zlib.crc32(str(key).encode("utf-8")) % count
+
+
+def partition(chunks, count: int, by: str = SHARD_BY_DOCUMENT) -> list:
+    groups = [[] for _ in range(count)]
+    for chunk in chunks:
+        groups[shard_of(chunk, count, by)].append(chunk)
+    return groups
+
+
+def write_layout(snapshot_dir: str, count: int, by: str):
+    with open(os.path.join(snapshot_dir, LAYOUT_FILE), "w", encoding="utf-8") as f:
+        json.dump({"count": count, "by": by}, f)
+
+
+def read_layout(snapshot_dir: str):
+    """{"count", "by"} for a sharded snapshot, None for a plain Chroma directory."""
+    try:
+        with open(os.path.join(snapshot_dir, LAYOUT_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def open_store(path: str, embedding, k: int = 4):
+    """Open a snapshot directory as a Chroma store or, if sharded, a ShardedStore."""
+    layout = read_layout(path)
+    if layout is None:
+        return Chroma(persist_directory=path, embedding_function=embedding)
+    urls = [u.strip() for u in os.getenv("RAG_SHARD_URLS", "").split(",") if u.strip()]
+    return ShardedStore(path, layout, embedding, k, urls or None)
+
+
+def filter_sources(where):
+    """Sources a Chroma where-filter restricts the search to, or None when unrestricted."""
+    if not where:
+        return None
+    if "$and" in where:
+        for clause in where["$and"]:
+            sources = filter_sources(clause)
+            if sources is not None:
+                return sources
+        return None
+    if "$or" in where:
+        # dedup.source_filter(): every alternative must name sources
+        alternatives = [filter_sources(clause) for clause in where["$or"]]
+        if not alternatives or any(a is None for a in alternatives):
+            return None
+        return list(dict.fromkeys(s for a in alternatives for s in a))
+    if len(where) == 1:
+        key, value = next(iter(where.items()))
+        if key.startswith(dedup.MEMBER_PREFIX) and value is True:
+            return [key[len(dedup.MEMBER_PREFIX):]]
+    condition = where.get("source")
+    if isinstance(condition, str):
+        return [condition]
+    if isinstance(condition, dict):
+        if "$eq" in condition:
+            return [condition["$eq"]]
+        if "$in" in condition:
+            return list(condition["$in"])
+    return None
+
+
+def build_filter(documents=None, page_range=None):
+    """
+    Chroma where-filter limiting retrieval to some documents and/or pages.
+
+    Args:
+        documents: source paths as stored at ingest, e.g. ["docs/healthcare.pdf"]
+        page_range: (first, last) 1-based inclusive page numbers; either may be None
+
+    A collapsed chunk (dedup.py) carries a flag per document it stands for,
+    so a document filter finds it whichever of those documents is asked
+    for, with dedup on or off. With dedup on, one chunk stands where dedup
+    off would return several copies, and its source and page are the kept
+    copy's, possibly another document. A collapsed chunk matches a page
+    range that overlaps the span of its copies' pages (page_first..page_last,
+    across all its documents), so a range can also match a chunk whose copy
+    in the filtered document lies outside it.
+    """
+    clauses = []
+    if documents:
+        clauses.append(dedup.source_filter(documents))
+    if page_range:
+        first, last = page_range
+        # Metadata pages are 0-based; page_first/page_last only exist on collapsed chunks
+        if first is not None:
+            clauses.append({"$or": [{"page": {"$gte": first - 1}}, {"page_last": {"$gte": first - 1}}]})
+        if last is not None:
+            clauses.append({"$or": [{"page": {"$lte": last - 1}}, {"page_first": {"$lte": last - 1}}]})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _close_chroma(store):
+    """Drop chromadb's cached client system for store's directory (SQLite handle, HNSW index)."""
+    client = getattr(store, "_client", None)
+    identifier = getattr(client, "_identifier", None)
+    if identifier is None:
+        return
+    try:
+        from chromadb.api.shared_system_client import SharedSystemClient
+    except ImportError:
+        try:
+            from chromadb.api.client import SharedSystemClient  # chromadb < 0.5
+        except ImportError:
+            return
+    systems = getattr(SharedSystemClient, "_identifer_to_system", None)  # sic, chromadb's spelling
+    system = systems.pop(identifier, None) if systems is not None else None
+    if system is not None:
+        system.stop()
+
+
+def close_store(store):
+    """Release what an opened store holds once no request uses it any more."""
+    if isinstance(store, ShardedStore):
+        store.close()
+    else:
+        _close_chroma(store)
+
+
+def update_metadatas(vectorstore, ids, metadatas):
+    """Replace chunk metadata in place (no re-embedding) on a Chroma or sharded store."""
+    if isinstance(vectorstore, ShardedStore):
+        vectorstore.update_metadatas(ids, metadatas)
+    else:
+        vectorstore._collection.update(ids=ids, metadatas=metadatas)
+
+
+# -----------------------------
+# Query side
+# -----------------------------
+class RemoteShard:
+    """Search client for a shard served by `python shards.py serve`."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/") + "/search"
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k: int, filter=None):
+        body = json.dumps({"embedding": list(embedding), "k": k, "filter": filter}).encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=REMOTE_TIMEOUT) as response:
+            hits = json.load(response)
+        return [(Document(page_content=h["page_content"], metadata=h["metadata"]), h["score"]) for h in hits]
+
+
+class ShardedStore:
+    """
+    Chroma-like store over N shards.
+
+    Searches fan out to every shard; writes go to the local shard
+    directories (adds are routed, deletes and lookups visit every shard).
+    A search returns the hits of the shards that answered as long as one
+    did; failed shards are counted in shard_errors_total.
+    """
+
+    def __init__(self, path: str, layout: dict, embedding, k: int = 4, urls=None):
+        self.embedding = embedding
+        self.k = k
+        self.by = layout.get("by", SHARD_BY_DOCUMENT)
+        count = layout["count"]
+        self.stores = [Chroma(persist_directory=shard_dir(path, i), embedding_function=embedding)
+                       for i in range(count)]
+        if urls and len(urls) != count:
+            raise ValueError(f"RAG_SHARD_URLS lists {len(urls)} workers for {count} shards")
+        self.searchers = [RemoteShard(u) for u in urls] if urls else self.stores
+        self._pool = ThreadPoolExecutor(max_workers=count, thread_name_prefix="rag-shard")
+
+    def _searchers_for(self, where):
+        """
+        With document sharding, a source filter only needs the shards holding
+        those sources plus the shard of chunks shared by several documents.
+        """
+        sources = filter_sources(where) if self.by == SHARD_BY_DOCUMENT else None
+        if sources is None:
+            return self.searchers
+        wanted = {zlib.crc32(str(source).encode("utf-8")) % len(self.searchers) for source in sources}
+        wanted.add(SHARED_SHARD)
+        return [s for i, s in enumerate(self.searchers) if i in wanted]
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k: int = None, filter=None):
+        k = k or self.k
+        searchers = self._searchers_for(filter)
+        futures = [self._pool.submit(s.similarity_search_by_vector_with_relevance_scores, embedding, k, filter=filter)
+                   for s in searchers]
+        hits, errors = [], []
+        for searcher, future in zip(searchers, futures):
+            try:
+                hits.extend(future.result())
+            except Exception as e:
+                metrics.increment("shard_errors_total", shard=str(self.searchers.index(searcher)))
+                errors.append(e)
+        if errors and len(errors) == len(futures):
+            raise errors[0]
+        if errors:
+            print(f"{len(errors)} of {len(futures)} shards failed, returning partial results: {errors[0]}")
+        hits.sort(key=lambda hit: hit[1])  # Chroma scores are distances: lower is closer
+        return hits[:k]
+
+    def similarity_search_by_vector(self, embedding, k: int = None, filter=None):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter)]
+
+    def similarity_search(self, query: str, k: int = None, filter=None):
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k, filter)
+
+    def invoke(self, query: str):
+        """Retriever interface used by rag_pipeline."""
+        return self.similarity_search(query, self.k)
+
+    def add_documents(self, documents):
+        ids = []
+        for shard, group in enumerate(partition(documents, len(self.stores), self.by)):
+            if group:
+                ids.extend(self.stores[shard].add_documents(group))
+        return ids
+
+    def get(self, **kwargs):
+        merged = {}
+        for store in self.stores:
+            for key, values in store.get(**kwargs).items():
+                if isinstance(values, list):
+                    merged.setdefault(key, []).extend(values)
+        merged.setdefault("ids", [])
+        merged.setdefault("metadatas", [])
+        return merged
+
+    def delete(self, ids):
+        for store in self.stores:
+            store.delete(ids=ids)
+
+    def update_metadatas(self, ids, metadatas):
+        by_id = dict(zip(ids, metadatas))
+        for store in self.stores:
+            found = store.get(ids=list(by_id), include=[])["ids"]
+            if found:
+                store._collection.update(ids=found, metadatas=[by_id[i] for i in found])
+
+    def persist(self):
+        for store in self.stores:
+            store.persist()
+
+    def close(self):
+        """Stop the search threads and release every shard's Chroma client."""
+        self._pool.shutdown(wait=False)
+        for store in self.stores:
+            _close_chroma(store)
+
+
+# -----------------------------
+# Shard worker process
+# -----------------------------
+def serve(root: str, shard: int, port: int, host: str = "127.0.0.1"):
+    """Serve one shard of the current snapshot of root over HTTP until interrupted."""
+
+    def open_shard(path):
+        # Opening a missing shard would create an empty Chroma directory inside a published snapshot
+        layout = read_layout(path)
+        if layout is None:
+            raise ValueError(f"{path} is not a sharded snapshot; re-ingest with --shards N")
+        if not 0 <= shard < layout["count"] or not os.path.isdir(shard_dir(path, shard)):
+            raise ValueError(f"{path} has no shard {shard} (it has {layout['count']})")
+        return Chroma(persist_directory=shard_dir(path, shard))
+
+    try:
+        handle = snapshots.IndexHandle(root, open_shard, close_store)
+    except ValueError as e:
+        raise SystemExit(f"Not serving: {e}")
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            version, store = handle.acquire()
+            try:
+                hits = store.similarity_search_by_vector_with_relevance_scores(
+                    request["embedding"], request["k"], filter=request.get("filter"))
+            finally:
+                handle.release(version)
+            body = json.dumps([
+                {"page_content": doc.page_content, "metadata": doc.metadata, "score": score}
+                for doc, score in hits
+            ]).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"Serving shard {shard} of {root} on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shard worker stopped.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shard worker for the sharded vectorstore")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="Serve one shard over HTTP")
+    serve_parser.add_argument("--root", default="db", help="Index root (as written by ingest.py)")
+    serve_parser.add_argument("--shard", type=int, required=True)
+    serve_parser.add_argument("--port", type=int, required=True)
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    args = parser.parse_args()
+    serve(args.root, args.shard, args.port, args.host)
+
+
+if __name__ == "__main__":
+    main()
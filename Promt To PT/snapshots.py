@@ -0,0 +1,400 @@
+# snapshots.py
+"""
+Versioned vectorstore snapshots with atomic publish and hot-swap.
+
+Layout under the index root (db/):
+    CURRENT               name of the published snapshot (replaced atomically)
+    snapshots/<version>/  one complete Chroma directory per ingest run, plus
+                          catalog.json (documents and their page counts)
+    leases/<pid>-<id>.json  snapshot versions each running reader still uses
+    WRITER.lock           held by whoever is building the next snapshot
+
+A root without CURRENT is treated as a single legacy index, so indexes
+built before snapshots keep working until the next ingest publishes one.
+"""
+import atexit
+import contextlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+import dedup
+import metrics
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# -----------------------------
+# Config
+# -----------------------------
+CURRENT_FILE = "CURRENT"
+SNAPSHOTS_DIR = "snapshots"
+LEASES_DIR = "leases"
+LEGACY_VERSION = ""
+CHECK_INTERVAL = 1.0  # seconds between checks for a newly published snapshot
+CATALOG_FILE = "catalog.json"  # per-snapshot index of documents and their pages
+WRITER_LOCK_FILE = "WRITER.lock"
+
+_writer_thread_lock = threading.Lock()
+_BUMPED_RE = re.compile(r"^(.*)\+(\d{6})-[0-9a-f]{6}$")
+
+
+def _new_version(current: str = LEGACY_VERSION) -> str:
+    """
+    Version name sorting after current (collect_garbage relies on the order).
+
+    Normally the UTC creation time down to the nanosecond; if the clock is
+    behind current's (NTP step, a version from another host), current's
+    name with a counter bumped.
+    """
+    now = time.time_ns()
+    tag = uuid.uuid4().hex[:6]
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime(now // 1_000_000_000))
+    version = f"{stamp}-{now % 1_000_000_000:09d}-{tag}"
+    if version > current:
+        return version
+    match = _BUMPED_RE.match(current)
+    base, counter = (match.group(1), int(match.group(2))) if match else (current, 0)
+    return f"{base}+{counter + 1:06d}-{tag}"
+
+
+def new_snapshot_dir(root: str) -> str:
+    """Create and return an empty directory for the next snapshot."""
+    version = _new_version(current_version(root))
+    path = os.path.join(root, SNAPSHOTS_DIR, version)
+    os.makedirs(path)
+    return path
+
+
+def clone_current(root: str) -> str:
+    """Copy the current snapshot into a new snapshot directory for incremental edits."""
+    path = new_snapshot_dir(root)
+    shutil.copytree(
+        snapshot_path(root, current_version(root)), path, dirs_exist_ok=True,
+        # A legacy root also holds the snapshot bookkeeping; never copy that
+        ignore=shutil.ignore_patterns(SNAPSHOTS_DIR, LEASES_DIR, CURRENT_FILE, f".{CURRENT_FILE}.*", WRITER_LOCK_FILE),
+    )
+    return path
+
+
+@contextlib.contextmanager
+def writer_lock(root: str):
+    """
+    Serialize snapshot writers (full ingest, watch mode, uploads) across
+    processes, so each clones the snapshot the previous one published
+    instead of overwriting its changes.
+    """
+    os.makedirs(root, exist_ok=True)
+    with _writer_thread_lock, open(os.path.join(root, WRITER_LOCK_FILE), "a") as f:
+        _lock_file(f)
+        try:
+            yield
+        finally:
+            _unlock_file(f)
+
+
+def _lock_file(f):
+    """Block until this process holds an exclusive lock on the open file f."""
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # gives up after ~10 s, so retry
+            return
+        except OSError:
+            continue
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def publish(root: str, snapshot_dir: str):
+    """Atomically make snapshot_dir the current snapshot of root."""
+    version = os.path.basename(os.path.normpath(snapshot_dir))
+    tmp_path = os.path.join(root, f".{CURRENT_FILE}.{uuid.uuid4().hex}")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+    return version
+
+
+def current_version(root: str) -> str:
+    """Published snapshot version, or LEGACY_VERSION for a plain Chroma directory."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return LEGACY_VERSION
+
+
+def snapshot_path(root: str, version: str) -> str:
+    if version == LEGACY_VERSION:
+        return root
+    return os.path.join(root, SNAPSHOTS_DIR, version)
+
+
+# -----------------------------
+# Document catalog
+# -----------------------------
+def build_catalog(metadatas) -> dict:
+    """Map each source to its page count and chunk count, from chunk metadata."""
+    catalog = {}
+    for metadata in metadatas:
+        if not metadata:
+            continue
+        # A collapsed chunk (dedup.py) counts for every document and page it stands for
+        for source, pages in dedup.member_pages(metadata).items():
+            entry = catalog.setdefault(source, {"pages": 0, "chunks": 0})
+            pages = [p for p in pages if isinstance(p, int)]
+            if pages:
+                entry["pages"] = max(entry["pages"], max(pages) + 1)
+            entry["chunks"] += 1
+    return catalog
+
+
+def write_catalog(snapshot_dir: str, catalog: dict):
+    with open(os.path.join(snapshot_dir, CATALOG_FILE), "w", encoding="utf-8") as f:
+        json.dump(catalog, f, indent=2, sort_keys=True)
+
+
+def read_catalog(snapshot_dir: str):
+    """Catalog of a snapshot, or None for indexes built before catalogs existed."""
+    try:
+        with open(os.path.join(snapshot_dir, CATALOG_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+# -----------------------------
+# Garbage collection
+# -----------------------------
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":
+        return _pid_alive_windows(pid)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _pid_alive_windows(pid: int) -> bool:
+    # os.kill(pid, 0) would terminate the process on Windows; ask for its exit code instead
+    import ctypes
+    from ctypes import wintypes
+
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    kernel32.GetExitCodeProcess.argtypes = [wintypes.HANDLE, ctypes.POINTER(wintypes.DWORD)]
+    kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+    handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+    if not handle:
+        return ctypes.get_last_error() == 5  # ERROR_ACCESS_DENIED: exists, owned by someone else
+    try:
+        code = wintypes.DWORD()
+        if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+            return True
+        return code.value == 259  # STILL_ACTIVE
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def _versions_in_use(root: str) -> set:
+    """Versions named by leases of live readers; leases of dead readers are removed."""
+    in_use = set()
+    leases_dir = os.path.join(root, LEASES_DIR)
+    if not os.path.isdir(leases_dir):
+        return in_use
+    for name in os.listdir(leases_dir):
+        path = os.path.join(leases_dir, name)
+        try:
+            pid = int(name.split("-", 1)[0])
+            with open(path, encoding="utf-8") as f:
+                versions = json.load(f)
+        except (ValueError, OSError):
+            continue
+        if _pid_alive(pid):
+            in_use.update(versions)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return in_use
+
+
+def collect_garbage(root: str) -> list:
+    """
+    Delete snapshots that are neither current nor used by a live reader.
+
+    Versions sort in creation order (see _new_version), so snapshots
+    newer than the current one (still being built) are never touched.
+    """
+    snapshots_dir = os.path.join(root, SNAPSHOTS_DIR)
+    if not os.path.isdir(snapshots_dir):
+        return []
+    current = current_version(root)
+    keep = _versions_in_use(root) | {current}
+    removed = []
+    for version in os.listdir(snapshots_dir):
+        if version in keep or version > current:
+            continue
+        path = os.path.join(snapshots_dir, version)
+        shutil.rmtree(path, ignore_errors=True)
+        if not os.path.exists(path):
+            removed.append(version)
+    return removed
+
+
+# -----------------------------
+# Reader side
+# -----------------------------
+class IndexHandle:
+    """
+    Process-local handle on the current snapshot of an index root.
+
+    acquire() returns the store to use for one request and swaps to a newly
+    published snapshot first if there is one; release() ends the request.
+    Versions still used by in-flight requests are recorded in a lease file
+    so other processes' garbage collection leaves them alone; once the last
+    request on an old snapshot finishes, its store is closed and garbage
+    collection runs in the background.
+
+    A snapshot that fails to open is logged and skipped; requests keep
+    using the current store until a newer snapshot is published.
+    """
+
+    def __init__(self, root: str, open_store, close_store=None):
+        self.root = root
+        self._open_store = open_store    # snapshot path -> store object
+        self._close_store = close_store  # store object -> None, for swapped-out stores
+        self._lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+        self._in_flight = {}           # version -> active request count
+        self._retired = {}             # old version -> store waiting for its last request
+        self._failed_version = None
+        self._closed = False
+        self._lease_path = os.path.join(root, LEASES_DIR, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json")
+        self._leased = None
+        self._checked_at = 0.0
+        self.version = current_version(root)
+        self.store = open_store(snapshot_path(root, self.version))
+        self._write_lease()
+        atexit.register(self.close)
+
+    def _write_lease(self):
+        versions = {v for v, count in self._in_flight.items() if count} | {self.version}
+        versions.discard(LEGACY_VERSION)
+        if versions == self._leased:
+            return
+        self._leased = versions
+        if not versions:
+            return
+        os.makedirs(os.path.dirname(self._lease_path), exist_ok=True)
+        tmp_path = self._lease_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(sorted(versions), f)
+        os.replace(tmp_path, self._lease_path)
+
+    def refresh(self, force: bool = False) -> bool:
+        """Swap to the published snapshot if it changed. Returns True on swap."""
+        now = time.monotonic()
+        if not force and now - self._checked_at < CHECK_INTERVAL:
+            return False
+        if self._closed or not self._swap_lock.acquire(blocking=False):
+            return False  # closed, or another thread is already checking or swapping
+        try:
+            self._checked_at = now
+            version = current_version(self.root)
+            if version == self.version or version == self._failed_version:
+                return False
+            # Open outside _lock so requests keep using the old store meanwhile
+            try:
+                store = self._open_store(snapshot_path(self.root, version))
+            except Exception as e:
+                self._failed_version = version
+                metrics.increment("snapshot_open_errors_total")
+                print(f"Could not open snapshot {version}, still serving {self.version or 'legacy index'}: {e}")
+                return False
+            with self._lock:
+                old_version, old_store = self.version, self.store
+                self.version, self.store = version, store
+                self._write_lease()
+                if self._in_flight.get(old_version):
+                    self._retired[old_version] = old_store
+                    old_store = None
+            if old_store is not None:
+                self._close(old_store)
+            return True
+        finally:
+            self._swap_lock.release()
+
+    def _close(self, store):
+        if self._close_store is None:
+            return
+        try:
+            self._close_store(store)
+        except Exception as e:
+            print(f"Could not close a retired snapshot store: {e}")
+
+    def acquire(self):
+        """Returns (version, store) for one request; pair with release(version)."""
+        self.refresh()
+        with self._lock:
+            version, store = self.version, self.store
+            self._in_flight[version] = self._in_flight.get(version, 0) + 1
+        return version, store
+
+    def release(self, version: str):
+        retired = None
+        with self._lock:
+            self._in_flight[version] -= 1
+            if not self._in_flight[version]:
+                del self._in_flight[version]
+                if version != self.version or self._closed:
+                    retired = self._retired.pop(version, None)
+                if version != self.version and not self._closed:
+                    self._write_lease()
+                    # Last request on an old snapshot finished; collect it off the request path
+                    threading.Thread(target=collect_garbage, args=(self.root,), daemon=True).start()
+        if retired is not None:
+            self._close(retired)
+
+    def close(self):
+        """Close the stores and drop the lease; a store still used by a request is closed on release()."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            to_close = []
+            if self._in_flight.get(self.version):
+                self._retired[self.version] = self.store
+            else:
+                to_close.append(self.store)
+        atexit.unregister(self.close)
+        for store in to_close:
+            self._close(store)
+        try:
+            os.remove(self._lease_path)
+        except OSError:
+            pass
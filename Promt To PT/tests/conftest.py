@@ -0,0 +1,6 @@
+# conftest.py
+import os
+import sys
+
+# The app's modules are flat files in the parent folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
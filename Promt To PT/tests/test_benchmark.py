@@ -0,0 +1,39 @@
+# test_benchmark.py
+import benchmark
+
+
+def _stages(p95_ms):
+    return {"retrieve": {"p50_ms": 1.0, "p95_ms": p95_ms, "p99_ms": p95_ms, "mean_ms": 1.0, "count": 3}}
+
+
+def test_percentile_and_summary():
+    values = [0.001 * i for i in range(1, 101)]
+    assert benchmark.percentile(values, 50) == 0.05
+    assert benchmark.percentile(values, 99) == 0.099
+    assert benchmark.percentile([], 95) == 0.0
+    summary = benchmark.summarize([0.002, 0.004])
+    assert summary["p50_ms"] == 2.0 and summary["mean_ms"] == 3.0 and summary["count"] == 2
+
+
+def test_compare_flags_slower_stages_and_lower_throughput():
+    baseline = {"stages": _stages(10.0), "throughput": {"4": {"qps": 20.0}}}
+    current = {"stages": _stages(12.0), "throughput": {"4": {"qps": 15.0}}}
+    assert benchmark.compare(current, baseline) == [
+        "stage retrieve: p95 10.0ms -> 12.0ms",
+        "concurrency 4: qps 20.0 -> 15.0",
+    ]
+
+
+def test_compare_tolerates_noise():
+    baseline = {"stages": _stages(10.0), "throughput": {"4": {"qps": 20.0}}}
+    current = {"stages": _stages(10.5), "throughput": {"4": {"qps": 19.0}}, "ingest": {"pages_per_sec": 1.0}}
+    assert benchmark.compare(current, baseline, tolerance=0.1) == []
+
+
+def test_compare_refuses_ingest_runs_with_different_text_cache_settings():
+    cached = {"ingest": {"text_cache": True, "pages_per_sec": 500.0}}
+    uncached = {"ingest": {"text_cache": False, "pages_per_sec": 50.0}}
+    assert benchmark.compare(uncached, cached) == [
+        "ingest: text cache off here but on in the baseline; not comparable"]
+    slower = {"ingest": {"text_cache": False, "pages_per_sec": 40.0}}
+    assert benchmark.compare(slower, uncached) == ["ingest: pages/sec 50.0 -> 40.0"]
@@ -0,0 +1,40 @@
+# test_caches.py
+import pytest
+
+pytest.importorskip("langchain_core")
+import caches  # noqa: E402
+
+
+def test_lru_evicts_least_recently_used():
+    cache = caches.LRUCache("test", 2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_zero_size_disables_cache():
+    cache = caches.LRUCache("test", 0)
+    cache.put("a", 1)
+    assert cache.get("a") is None and len(cache) == 0
+
+
+def test_query_embeddings_cached_as_float32():
+    class Base:
+        calls = 0
+
+        def embed_query(self, text):
+            self.calls += 1
+            return [0.5, 0.25]
+
+        def embed_documents(self, texts):
+            return [[0.5, 0.25] for _ in texts]
+
+    embedding = caches.CachedQueryEmbeddings(Base(), 8)
+    assert embedding.embed_query("q") == [0.5, 0.25]
+    assert embedding.embed_query("q") == [0.5, 0.25]
+    assert embedding.base.calls == 1
+    assert embedding.cache.get("q").dtype.name == "float32"
+    assert embedding.prefill(["q", "r", "r"]) == 1
@@ -0,0 +1,16 @@
+# test_chunk_quality.py
+import chunk_quality
+
+PROSE = ("Diabetes is a chronic disease that occurs when the pancreas does not produce enough insulin "
+         "or when the body cannot effectively use the insulin it produces.")
+
+
+def test_clean_prose_scores_high():
+    assert chunk_quality.score_chunk(PROSE) > 0.8
+
+
+def test_junk_scores_zero():
+    assert chunk_quality.score_chunk("Too short to be useful.") == 0.0
+    assert chunk_quality.score_chunk(" ".join(["12.5", "(3)", "40%"] * 10)) == 0.0
+    toc = "\n".join(f"Chapter {i} overview of the topic ........ {i * 7}" for i in range(1, 12))
+    assert chunk_quality.score_chunk(toc) == 0.0
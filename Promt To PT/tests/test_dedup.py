@@ -0,0 +1,91 @@
+# test_dedup.py
+from types import SimpleNamespace
+
+import pytest
+
+import dedup
+import snapshots
+
+BOILERPLATE = ("This document is distributed under the terms of the licence agreement "
+               "and may be freely reviewed, abstracted, reproduced or translated in part. ") * 2
+
+
+def _chunk(text, source, page, quality=0.5):
+    return SimpleNamespace(page_content=text, metadata={"source": source, "page": page, "quality": quality})
+
+
+def test_drop_source_repoints_at_next_reference():
+    metadata = {"source": "docs/a.pdf", "page": 1, "refs": "docs/a.pdf#1|docs/b.pdf#4|docs/b.pdf#7|docs/c.pdf#2",
+                "duplicates": 3}
+    remaining = dedup.drop_source(metadata, "docs/a.pdf")
+    assert remaining["source"] == "docs/b.pdf"
+    assert remaining["page"] == 4
+    assert remaining["refs"] == "docs/b.pdf#4|docs/b.pdf#7|docs/c.pdf#2"
+    assert remaining["duplicates"] == 2
+    assert (remaining["page_first"], remaining["page_last"]) == (2, 7)
+    assert sorted(dedup.member_sources(remaining)) == ["docs/b.pdf", "docs/c.pdf"]
+    assert metadata["source"] == "docs/a.pdf"  # input is not modified
+
+
+def test_drop_source_deletes_chunk_without_other_references():
+    assert dedup.drop_source({"source": "a.pdf", "page": 0}, "a.pdf") is None
+    assert dedup.drop_source({"source": "a.pdf", "page": 0, "refs": "a.pdf#0|a.pdf#3"}, "a.pdf") is None
+
+
+def _matches(metadata, where) -> bool:
+    """The subset of Chroma's where-filter semantics used by source_filter()."""
+    if "$or" in where:
+        return any(_matches(metadata, clause) for clause in where["$or"])
+    (key, condition), = where.items()
+    if isinstance(condition, dict):
+        return metadata.get(key) in condition["$in"]
+    return metadata.get(key) == condition
+
+
+def test_collapse_merges_across_documents():
+    chunks = [
+        _chunk(BOILERPLATE, "a.pdf", 3),
+        _chunk(BOILERPLATE, "a.pdf", 9, quality=0.9),
+        _chunk(BOILERPLATE, "b.pdf", 1),
+        _chunk("Gestational diabetes is hyperglycaemia first detected during pregnancy "
+               "and is diagnosed with a 75 g oral glucose tolerance test.", "a.pdf", 5),
+    ]
+    kept, removed = dedup.collapse(chunks)
+
+    assert removed == 2
+    merged = next(c for c in kept if c.metadata.get("refs"))
+    assert merged.metadata["page"] == 9  # best quality copy is kept
+    assert merged.metadata["refs"] == "a.pdf#9|a.pdf#3|b.pdf#1"
+    assert (merged.metadata["page_first"], merged.metadata["page_last"]) == (1, 9)
+    assert sorted(dedup.member_sources(merged.metadata)) == ["a.pdf", "b.pdf"]
+
+
+def test_shared_chunk_matches_a_filter_on_either_document():
+    kept, _ = dedup.collapse([_chunk(BOILERPLATE, "docs/a.pdf", 0), _chunk(BOILERPLATE, "docs/b.pdf", 2)])
+    (shared,) = kept
+    for source in ("docs/a.pdf", "docs/b.pdf"):
+        assert _matches(shared.metadata, dedup.source_filter([source]))
+    assert _matches(shared.metadata, dedup.source_filter(["docs/c.pdf", "docs/b.pdf"]))
+    assert not _matches(shared.metadata, dedup.source_filter(["docs/c.pdf"]))
+
+    remaining = dedup.drop_source(shared.metadata, "docs/a.pdf")
+    assert not _matches(remaining, dedup.source_filter(["docs/a.pdf"]))
+    assert _matches(remaining, dedup.source_filter(["docs/b.pdf"]))
+
+
+def test_shared_chunk_matches_a_chroma_filter_on_either_document():
+    chromadb = pytest.importorskip("chromadb")
+    kept, _ = dedup.collapse([_chunk(BOILERPLATE, "docs/a.pdf", 0), _chunk(BOILERPLATE, "docs/b.pdf", 2),
+                              _chunk("Insulin therapy is started when diet and exercise fail to keep glucose in range.", "docs/c.pdf", 0)])
+    collection = chromadb.EphemeralClient().create_collection("dedup-test")
+    collection.add(ids=[str(i) for i in range(len(kept))], embeddings=[[float(i), 1.0] for i in range(len(kept))],
+                   metadatas=[c.metadata for c in kept], documents=[c.page_content for c in kept])
+    for source in ("docs/a.pdf", "docs/b.pdf"):
+        found = collection.get(where=dedup.source_filter([source]))["metadatas"]
+        assert [m["refs"] for m in found] == ["docs/a.pdf#0|docs/b.pdf#2"]
+
+
+def test_catalog_counts_every_member_document():
+    kept, _ = dedup.collapse([_chunk(BOILERPLATE, "a.pdf", 0), _chunk(BOILERPLATE, "b.pdf", 6)])
+    catalog = snapshots.build_catalog(c.metadata for c in kept)
+    assert catalog == {"a.pdf": {"pages": 1, "chunks": 1}, "b.pdf": {"pages": 7, "chunks": 1}}
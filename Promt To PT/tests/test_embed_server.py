@@ -0,0 +1,111 @@
+# test_embed_server.py
+import socket
+import socketserver
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+pytest.importorskip("langchain_core")
+import embed_server  # noqa: E402
+
+
+class FakeModel:
+    def embed_documents(self, texts):
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+@pytest.fixture
+def garbage_server():
+    """A server answering every request with a header that is not JSON."""
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for _ in self.rfile:
+                self.wfile.write(b"{not json\n")
+                self.wfile.flush()
+
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_corrupt_header_falls_back_to_local_model(garbage_server):
+    client = embed_server.EmbeddingClient(garbage_server, "fake", local=FakeModel)
+    assert client.embed_documents(["abc", "de"]) == [[3.0, 1.0], [2.0, 1.0]]
+    assert client._idle.qsize() == 0  # the out-of-sync connection was closed, not pooled
+
+
+def test_corrupt_header_without_fallback_raises(garbage_server):
+    client = embed_server.EmbeddingClient(garbage_server, "fake")
+    with pytest.raises(ValueError):
+        client.embed_documents(["abc"])
+    assert client._idle.qsize() == 0
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def server_address():
+    """embed_server.serve() with FakeModel standing in for the HuggingFace model."""
+    address = f"127.0.0.1:{_free_port()}"
+    fake_module = types.ModuleType("langchain_huggingface")
+    fake_module.HuggingFaceEmbeddings = lambda model_name: FakeModel()
+    saved = sys.modules.get("langchain_huggingface")
+    sys.modules["langchain_huggingface"] = fake_module
+    try:
+        threading.Thread(target=embed_server.serve, args=(address, "fake-model"), daemon=True).start()
+        client = embed_server.EmbeddingClient(address, "fake-model")
+        deadline = time.monotonic() + 5
+        while True:
+            try:
+                client.info()
+                break
+            except OSError:
+                assert time.monotonic() < deadline, "embedding server did not start"
+                time.sleep(0.02)
+    finally:
+        if saved is None:
+            sys.modules.pop("langchain_huggingface", None)
+        else:
+            sys.modules["langchain_huggingface"] = saved
+    return address
+
+
+def test_client_round_trip(server_address):
+    client = embed_server.get_embedding("fake-model", local=lambda: pytest.fail("used the local model"),
+                                        address=server_address)
+    assert isinstance(client, embed_server.EmbeddingClient)
+    texts = [f"text {'x' * i}" for i in range(embed_server.CLIENT_BATCH + 5)]  # spans two requests
+    assert client.embed_documents(texts) == FakeModel().embed_documents(texts)
+    assert client.embed_query("abc") == [3.0, 1.0]
+    assert client._idle.qsize() == 1  # the connection is reused
+
+
+def test_other_model_on_the_server_is_not_used(server_address):
+    local = FakeModel()
+    assert embed_server.get_embedding("other-model", local=lambda: local, address=server_address) is local
+
+
+def test_no_server_means_local_model():
+    local = FakeModel()
+    assert embed_server.get_embedding("fake-model", local=lambda: local, address=f"127.0.0.1:{_free_port()}") is local
+    assert embed_server.get_embedding("fake-model", local=lambda: local, address="off") is local
+
+
+def test_server_gone_mid_run_falls_back_to_local_model():
+    client = embed_server.EmbeddingClient(f"127.0.0.1:{_free_port()}", "fake-model", local=FakeModel)
+    assert client.embed_documents(["ab"]) == [[2.0, 1.0]]
+    assert client._local is not None  # later calls skip the server
@@ -0,0 +1,45 @@
+# test_evaluate.py
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain_community")
+import evaluate  # noqa: E402
+
+ITEM = {"question": "What is gestational diabetes?", "source": "diabetes.pdf", "pages": [4, 7],
+        "answer_terms": ["first detected during pregnancy"]}
+
+
+def _doc(source, page, refs=None):
+    metadata = {"source": source, "page": page}
+    if refs:
+        metadata["refs"] = refs
+    return SimpleNamespace(page_content="", metadata=metadata)
+
+
+def test_relevant_pages_match_by_basename_and_page():
+    assert evaluate.relevant_pages(_doc("docs\\diabetes.pdf", 4), ITEM) == {4}
+    assert evaluate.relevant_pages(_doc("docs/diabetes.pdf", 5), ITEM) == set()
+    assert evaluate.relevant_pages(_doc("docs/other.pdf", 4), ITEM) == set()
+
+
+def test_collapsed_copies_count_as_relevant():
+    doc = _doc("docs/other.pdf", 0, "docs/other.pdf#0|docs/diabetes.pdf#7|docs/diabetes.pdf#4")
+    assert evaluate.relevant_pages(doc, ITEM) == {4, 7}
+    assert evaluate.is_relevant(doc, ITEM)
+
+
+def test_eval_retrieval_scores_recall_hit_and_mrr():
+    results = {ITEM["question"]: [_doc("docs/other.pdf", 1), _doc("docs/diabetes.pdf", 4)],
+               "Unrelated?": [_doc("docs/other.pdf", 2)]}
+    store = SimpleNamespace(similarity_search=lambda question, k: results[question][:k])
+    miss = dict(ITEM, question="Unrelated?")
+    scores = evaluate.eval_retrieval(store, [ITEM, miss], k=2)
+    assert scores["recall@2"] == 0.25  # half of the pages, then nothing
+    assert scores["hit@2"] == 0.5
+    assert scores["mrr"] == 0.25
+
+
+def test_answer_hit_is_case_insensitive():
+    assert evaluate.answer_hit("Hyperglycaemia FIRST DETECTED DURING PREGNANCY.", ITEM)
+    assert not evaluate.answer_hit("No relevant information found.", ITEM)
@@ -0,0 +1,47 @@
+# test_history.py
+import time
+
+import pytest
+
+import history
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    path = str(tmp_path / "history.sqlite3")
+    monkeypatch.setattr(history, "DB_PATH", path)
+    history.enable()
+    return path
+
+
+def test_logged_queries_are_batched_and_restored(db):
+    for i in range(5):
+        history.log_query("s1", "What is diabetes?", "• Answer", ["docs/a.pdf"], {"retrieve": 0.01, "total": 0.02})
+    history.log_query("s2", "what is  Diabetes", "• Answer", [], {})
+    assert history.flush()
+
+    chat = history.load_chat("s1")
+    assert chat[:3] == [
+        {"type": "question", "text": "What is diabetes?"},
+        {"type": "answer", "text": "• Answer"},
+        {"type": "source", "text": "a.pdf"},
+    ]
+    assert history.top_questions()[0][1] == 6  # normalized questions share a key
+    conn = history.connect(db)
+    assert conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] == 1  # stored once
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+
+
+def test_compact_applies_retention(tmp_path):
+    # The writer thread keeps the database it started with, so write directly here
+    conn = history.connect(str(tmp_path / "history.sqlite3"))
+    history._write(conn, [
+        ("old", time.time() - 10 * 86400, "Old question?", "• Old", [], {}, None),
+        ("new", time.time(), "New question?", "• New", [], {}, None),
+    ])
+
+    assert history.compact(retention_days=5, conn=conn) == 1
+    assert conn.execute("SELECT id FROM sessions").fetchall() == [("new",)]
+    assert conn.execute("SELECT text FROM answers").fetchall() == [("• New",)]
+    conn.close()
@@ -0,0 +1,60 @@
+# test_indexer.py
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain_community")
+import indexer  # noqa: E402
+import ingest  # noqa: E402
+
+
+@pytest.fixture
+def fake_index(monkeypatch):
+    """Record index_files() calls instead of embedding; the worker imports rag_pipeline lazily."""
+    calls = []
+
+    def index_files(embedding, paths, progress=None):
+        calls.append(list(paths))
+        for path in paths:
+            progress(path, 5, 10)
+            progress(path, 10, 10)
+        return 10 * len(paths)
+
+    monkeypatch.setitem(sys.modules, "rag_pipeline", SimpleNamespace(embedding=None, refresh_index=lambda: None))
+    monkeypatch.setattr(ingest, "index_files", index_files)
+    return calls
+
+
+def _wait(job_id):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        job = next(j for j in indexer.jobs() if j["id"] == job_id)
+        if not indexer.is_active(job):
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+
+def test_one_job_indexes_a_whole_upload(fake_index):
+    job_id = indexer.submit(["docs/b.pdf", "docs/a.pdf"])
+    job = _wait(job_id)
+    assert fake_index == [["docs/a.pdf", "docs/b.pdf"]]
+    assert (job["status"], job["progress"], job["chunks"]) == ("done", 1.0, 20)
+    assert job["file"] == "a.pdf, b.pdf"
+
+
+def test_failed_job_reports_error(fake_index, monkeypatch):
+    monkeypatch.setattr(ingest, "index_files", lambda *args, **kwargs: 1 / 0)
+    job = _wait(indexer.submit(["docs/a.pdf"]))
+    assert job["status"] == "failed" and "division" in job["error"]
+
+
+def test_save_upload_refuses_to_overwrite(tmp_path):
+    path = indexer.save_upload("guide.pdf", b"one", str(tmp_path))
+    with pytest.raises(FileExistsError):
+        indexer.save_upload("guide.pdf", b"two", str(tmp_path))
+    assert open(path, "rb").read() == b"one"
+    indexer.save_upload("../guide.pdf", b"two", str(tmp_path), replace=True)
+    assert open(path, "rb").read() == b"two"
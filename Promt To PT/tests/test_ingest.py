@@ -0,0 +1,91 @@
+# test_ingest.py
+import os
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain_community")
+import ingest  # noqa: E402
+import shards  # noqa: E402
+import snapshots  # noqa: E402
+
+
+class StopWatching(Exception):
+    pass
+
+
+def test_watch_waits_for_docs_to_settle_then_applies_once(monkeypatch):
+    clock = SimpleNamespace(now=0.0)
+
+    def sleep(seconds):
+        clock.now += seconds
+
+    scans = iter([{"docs/a.pdf": [1, 10]}] + [{"docs/a.pdf": [1, 10], "docs/b.pdf": [2, 20]}] * 5)
+
+    def scan_docs(docs_dir):
+        try:
+            return next(scans)
+        except StopIteration:
+            raise StopWatching
+
+    applied = []
+
+    def apply_changes(embedding, changed, removed, progress=None):
+        applied.append((clock.now, sorted(changed), list(removed)))
+        return {"docs/a.pdf": [1, 10], "docs/b.pdf": [2, 20]}, 2
+
+    monkeypatch.setattr(ingest, "time", SimpleNamespace(sleep=sleep, monotonic=lambda: clock.now))
+    monkeypatch.setattr(ingest, "scan_docs", scan_docs)
+    monkeypatch.setattr(ingest, "apply_changes", apply_changes)
+    monkeypatch.setattr(ingest, "_indexed_manifest", lambda embedding: {"docs/old.pdf": [0, 1]})
+    monkeypatch.setattr(ingest, "_lower_priority", lambda: None)
+
+    with pytest.raises(StopWatching):
+        ingest.watch(None, poll_interval=1.0, debounce=3.0)
+    # docs/ last changed at t=2; applied once it had been unchanged for 3 s
+    assert applied == [(5.0, ["docs/a.pdf", "docs/b.pdf"], ["docs/old.pdf"])]
+
+
+class FakeStore:
+    def get(self, **kwargs):
+        return {"ids": [], "metadatas": []}
+
+    def persist(self):
+        pass
+
+
+@pytest.fixture
+def index_root(tmp_path, monkeypatch):
+    root = str(tmp_path / "db")
+    first = snapshots.new_snapshot_dir(root)
+    ingest.write_manifest(first, {"docs/a.pdf": [1, 10]})
+    snapshots.publish(root, first)
+    upserted = []
+
+    def upsert_file(store, path, progress=None):
+        upserted.append(path)
+        return 3
+
+    monkeypatch.setattr(ingest, "DB_DIR", root)
+    monkeypatch.setattr(ingest, "upsert_file", upsert_file)
+    monkeypatch.setattr(shards, "open_store", lambda path, embedding: FakeStore())
+    monkeypatch.setattr(shards, "close_store", lambda store: None)
+    return SimpleNamespace(root=root, first=os.path.basename(first), upserted=upserted)
+
+
+def test_apply_changes_skips_work_another_writer_did(index_root):
+    manifest, indexed = ingest.apply_changes(None, {"docs/a.pdf": [1, 10]}, removed=["docs/gone.pdf"])
+    assert (manifest, indexed) == ({"docs/a.pdf": [1, 10]}, 0)
+    assert index_root.upserted == []
+    assert snapshots.current_version(index_root.root) == index_root.first
+    assert os.listdir(os.path.join(index_root.root, snapshots.SNAPSHOTS_DIR)) == [index_root.first]
+
+
+def test_apply_changes_publishes_only_the_new_work(index_root):
+    changed = {"docs/a.pdf": [1, 10], "docs/b.pdf": [2, 20]}
+    manifest, indexed = ingest.apply_changes(None, changed)
+    assert index_root.upserted == ["docs/b.pdf"]
+    assert (manifest, indexed) == (changed, 3)
+    current = snapshots.current_version(index_root.root)
+    assert current > index_root.first
+    assert ingest.read_manifest(snapshots.snapshot_path(index_root.root, current)) == changed
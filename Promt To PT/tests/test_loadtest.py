@@ -0,0 +1,36 @@
+# test_loadtest.py
+import loadtest
+
+
+def _step(rate, p95_ms, concurrency=8, error_rate=0.0, achieved=None, saturated=False):
+    return {"rate": rate, "concurrency": concurrency, "offered_rps": rate,
+            "achieved_rps": rate if achieved is None else achieved, "error_rate": error_rate,
+            "latency": {"p95_ms": p95_ms}, "saturated": saturated}
+
+
+def test_saturation():
+    assert not loadtest.saturated(_step(4, 100.0))
+    assert loadtest.saturated(_step(4, 100.0, achieved=3.0))      # backlog grew
+    assert loadtest.saturated(_step(4, 100.0, error_rate=0.05))
+    assert loadtest.saturated(_step(4, 900.0), slo_p95_ms=500.0)
+
+
+def test_max_sustainable_rate_per_concurrency():
+    steps = [_step(1, 50.0), _step(2, 60.0), _step(4, 90.0, saturated=True), _step(1, 40.0, concurrency=16)]
+    assert loadtest.max_sustainable(steps) == {"8": 2, "16": 1}
+
+
+def test_compare_flags_latency_errors_and_lower_capacity():
+    baseline = {"caches": False, "steps": [_step(2, 100.0)], "max_sustainable_rps": {"8": 4}}
+    current = {"caches": False, "steps": [_step(2, 150.0, error_rate=0.05)], "max_sustainable_rps": {"8": 2}}
+    assert loadtest.compare(current, baseline) == [
+        "concurrency 8 @ 2 req/s: p95 100.0ms -> 150.0ms",
+        "concurrency 8 @ 2 req/s: error rate 0.0% -> 5.0%",
+        "concurrency 8: sustainable rate 4 -> 2 req/s",
+    ]
+    assert loadtest.compare(baseline, baseline) == []
+
+
+def test_compare_refuses_runs_with_different_cache_settings():
+    assert loadtest.compare({"caches": True, "steps": []}, {"caches": False, "steps": []}) == [
+        "caches on here but off in the baseline; runs are not comparable"]
@@ -0,0 +1,29 @@
+# test_metrics.py
+import pytest
+
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def enabled():
+    metrics.reset()
+    metrics.enable()
+    yield
+    metrics.disable()
+    metrics.reset()
+
+
+def test_prometheus_export():
+    metrics.increment("retrieval_fallback_total", to="similarity_search")
+    metrics.record_trace("q", {"retrieve": 0.02, "total": 3.0})
+    text = metrics.export_prometheus()
+    assert 'rag_retrieval_fallback_total{to="similarity_search"} 1' in text
+    assert 'rag_stage_seconds_bucket{stage="retrieve",le="0.025"} 1' in text
+    assert 'rag_stage_seconds_bucket{stage="total",le="2.5"} 0' in text
+    assert 'rag_stage_seconds_count{stage="total"} 1' in text
+
+
+def test_disabled_records_nothing():
+    metrics.disable()
+    metrics.increment("no_answer_total")
+    assert metrics.export_prometheus() == "\n"
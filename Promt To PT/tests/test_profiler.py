@@ -0,0 +1,60 @@
+# test_profiler.py
+import collections
+import json
+import time
+
+import pytest
+
+import profiler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(profiler, "_dump_times", collections.deque())
+    monkeypatch.setattr(profiler.time, "monotonic", clock.monotonic)
+    return clock
+
+
+def test_dumps_are_rate_limited_per_window(clock):
+    allowed = [profiler._allow_dump() for _ in range(profiler.MAX_PROFILES_PER_WINDOW + 2)]
+    assert allowed == [True] * profiler.MAX_PROFILES_PER_WINDOW + [False, False]
+
+    clock.now += profiler.RATE_WINDOW / 2
+    assert not profiler._allow_dump()
+    clock.now += profiler.RATE_WINDOW / 2 + 1  # the first dumps left the window
+    assert profiler._allow_dump()
+
+
+def test_slow_call_writes_a_profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, "_dump_times", collections.deque())
+    # enable() sets these module settings; monkeypatch restores them afterwards
+    monkeypatch.setattr(profiler, "PROFILE_DIR", profiler.PROFILE_DIR)
+    monkeypatch.setattr(profiler, "_threshold", profiler._threshold)
+    profiler.enable(threshold=0.0, profile_dir=str(tmp_path))
+    try:
+        token = profiler.start()
+        deadline = time.monotonic() + 0.2
+        while time.monotonic() < deadline:
+            pass
+        path = profiler.stop(token, "What is diabetes?", 0.2, ["a.pdf:1"], {"retrieve": 0.1})
+    finally:
+        profiler.disable()
+    assert path and path.endswith(".folded")
+    info = json.loads(open(path[:-len(".folded")] + ".json").read())
+    assert info["chunk_ids"] == ["a.pdf:1"] and info["samples"] > 0
+    assert "test_slow_call_writes_a_profile" in open(path).read()
+
+
+def test_disabled_profiler_returns_no_token():
+    profiler.disable()
+    assert profiler.start() is None
+    assert profiler.stop(None, "q", 10.0) is None
@@ -0,0 +1,154 @@
+# test_shards.py
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain_community")
+import metrics  # noqa: E402
+import shards  # noqa: E402
+
+
+class FakeShard:
+    def __init__(self, hits=(), error=None):
+        self.hits, self.error = list(hits), error
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k, filter=None):
+        if self.error:
+            raise self.error
+        return self.hits[:k]
+
+
+def _hit(name, distance):
+    return SimpleNamespace(page_content=name, metadata={"source": name}), distance
+
+
+def _store(searchers, by=shards.SHARD_BY_CHUNK):
+    store = object.__new__(shards.ShardedStore)
+    store.k, store.by, store.searchers = 2, by, searchers
+    store._pool = ThreadPoolExecutor(max_workers=len(searchers))
+    return store
+
+
+@pytest.fixture
+def counted():
+    metrics.reset()
+    metrics.enable()
+    yield
+    metrics.disable()
+    metrics.reset()
+
+
+def test_down_shard_returns_the_other_shards_hits(counted):
+    store = _store([FakeShard([_hit("a", 0.3)]), FakeShard(error=TimeoutError("shard 1 down")),
+                    FakeShard([_hit("c", 0.1), _hit("d", 0.9)])])
+    hits = store.similarity_search_by_vector_with_relevance_scores([0.0], 2)
+    assert [doc.page_content for doc, _ in hits] == ["c", "a"]
+    assert 'rag_shard_errors_total{shard="1"} 1' in metrics.export_prometheus()
+
+
+def test_all_shards_down_raises():
+    store = _store([FakeShard(error=TimeoutError("down")), FakeShard(error=ConnectionError("down"))])
+    with pytest.raises(TimeoutError):
+        store.similarity_search_by_vector([0.0])
+
+
+def test_serve_refuses_unsharded_snapshot(tmp_path):
+    root = tmp_path / "db"
+    snapshot = root / "snapshots" / "v1"
+    snapshot.mkdir(parents=True)
+    (root / "CURRENT").write_text("v1")
+    with pytest.raises(SystemExit, match="not a sharded snapshot"):
+        shards.serve(str(root), 0, 0)
+    assert not (snapshot / "shard-00").exists()
+
+
+def _chunk(source, text="text", **metadata):
+    return SimpleNamespace(page_content=text, metadata={"source": source, **metadata})
+
+
+def test_document_partition_keeps_each_document_in_one_shard():
+    chunks = [_chunk(f"docs/{d}.pdf", text=f"{d}{i}") for d in "abcdef" for i in range(3)]
+    groups = shards.partition(chunks, 3)
+    assert sum(len(g) for g in groups) == len(chunks)
+    for group in groups:
+        for chunk in group:
+            assert all(c in group for c in chunks if c.metadata["source"] == chunk.metadata["source"])
+
+
+def test_chunk_shared_by_documents_goes_to_the_shared_shard():
+    shared = _chunk("docs/a.pdf", **{"in:docs/a.pdf": True, "in:docs/b.pdf": True})
+    assert shards.shard_of(shared, 4) == shards.SHARED_SHARD
+    assert shards.shard_of(shared, 4, shards.SHARD_BY_CHUNK) == shards.shard_of(_chunk("x"), 4, shards.SHARD_BY_CHUNK)
+
+
+def test_filter_sources():
+    assert shards.filter_sources(None) is None
+    assert shards.filter_sources({"source": "a.pdf"}) == ["a.pdf"]
+    assert shards.filter_sources({"source": {"$in": ["a.pdf", "b.pdf"]}}) == ["a.pdf", "b.pdf"]
+    assert shards.filter_sources({"$and": [{"page": {"$gte": 2}}, {"source": {"$eq": "a.pdf"}}]}) == ["a.pdf"]
+    assert shards.filter_sources({"$or": [{"source": "a.pdf"}, {"in:a.pdf": True}]}) == ["a.pdf"]
+    assert shards.filter_sources({"$or": [{"page": {"$gte": 1}}, {"page_last": {"$gte": 1}}]}) is None
+    assert shards.filter_sources({"page": 3}) is None
+
+
+def test_hits_are_merged_by_distance_across_shards():
+    store = _store([FakeShard([_hit("a", 0.5), _hit("b", 0.7)]), FakeShard([_hit("c", 0.2), _hit("d", 0.6)])])
+    hits = store.similarity_search_by_vector_with_relevance_scores([0.0], 3)
+    assert [(doc.page_content, score) for doc, score in hits] == [("c", 0.2), ("a", 0.5), ("d", 0.6)]
+
+
+def test_scoped_search_only_visits_shards_that_can_hold_the_documents():
+    searchers = [FakeShard() for _ in range(4)]
+    store = _store(searchers, by=shards.SHARD_BY_DOCUMENT)
+    source = next(f"docs/{i}.pdf" for i in range(100)
+                  if shards.shard_of(_chunk(f"docs/{i}.pdf"), 4) != shards.SHARED_SHARD)
+    visited = store._searchers_for({"$or": [{"source": source}, {f"in:{source}": True}]})
+    assert visited == [searchers[shards.SHARED_SHARD], searchers[shards.shard_of(_chunk(source), 4)]]
+    assert _store(searchers)._searchers_for({"source": source}) == searchers  # chunk sharding: every shard
+
+
+def _matches(metadata, where) -> bool:
+    """The subset of Chroma's where-filter semantics build_filter() uses."""
+    if "$and" in where:
+        return all(_matches(metadata, clause) for clause in where["$and"])
+    if "$or" in where:
+        return any(_matches(metadata, clause) for clause in where["$or"])
+    (key, condition), = where.items()
+    if key not in metadata:
+        return False
+    value = metadata[key]
+    if not isinstance(condition, dict):
+        return value == condition
+    (op, operand), = condition.items()
+    return {"$in": lambda: value in operand, "$gte": lambda: value >= operand,
+            "$lte": lambda: value <= operand, "$eq": lambda: value == operand}[op]()
+
+
+def test_build_filter_without_scope_is_none():
+    assert shards.build_filter() is None
+    assert shards.build_filter([], None) is None
+
+
+def test_build_filter_documents_and_pages():
+    where = shards.build_filter(["docs/a.pdf"], (2, 3))  # 1-based pages 2..3 are 0-based 1..2
+    assert _matches({"source": "docs/a.pdf", "page": 1}, where)
+    assert _matches({"source": "docs/a.pdf", "page": 2}, where)
+    assert not _matches({"source": "docs/a.pdf", "page": 3}, where)
+    assert not _matches({"source": "docs/b.pdf", "page": 1}, where)
+    assert shards.filter_sources(where) == ["docs/a.pdf"]
+
+
+def test_build_filter_open_ended_page_range():
+    where = shards.build_filter(page_range=(None, 2))
+    assert _matches({"source": "x", "page": 0}, where) and not _matches({"source": "x", "page": 2}, where)
+
+
+def test_build_filter_finds_a_collapsed_chunk_from_any_of_its_documents():
+    shared = {"source": "docs/b.pdf", "page": 40, "refs": "docs/b.pdf#40|docs/a.pdf#2",
+              "in:docs/a.pdf": True, "in:docs/b.pdf": True, "page_first": 2, "page_last": 40}
+    assert _matches(shared, shards.build_filter(["docs/a.pdf"], (3, 3)))  # copy on 0-based page 2
+    assert _matches(shared, shards.build_filter(["docs/b.pdf"], (41, 41)))
+    assert _matches(shared, shards.build_filter(["docs/a.pdf", "docs/c.pdf"]))
+    assert not _matches(shared, shards.build_filter(["docs/c.pdf"]))
+    assert not _matches(shared, shards.build_filter(["docs/a.pdf"], (50, 60)))
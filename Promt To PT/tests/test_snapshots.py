@@ -0,0 +1,188 @@
+# test_snapshots.py
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import snapshots
+
+
+def _publish_new(root):
+    path = snapshots.new_snapshot_dir(root)
+    snapshots.publish(root, path)
+    return os.path.basename(path)
+
+
+def test_versions_sort_after_current(tmp_path):
+    root = str(tmp_path)
+    current = _publish_new(root)
+    versions = [os.path.basename(snapshots.new_snapshot_dir(root)) for _ in range(20)]
+    assert versions == sorted(versions)
+    assert versions[0] > current
+
+
+def test_versions_sort_after_current_from_the_future(tmp_path):
+    root = str(tmp_path)
+    # Published by a clock that was ahead, or before an NTP step back
+    ahead = "29991231-235959-000000000-abcdef"
+    snapshots.publish(root, str(tmp_path / snapshots.SNAPSHOTS_DIR / ahead))
+    first = os.path.basename(snapshots.new_snapshot_dir(root))
+    snapshots.publish(root, snapshots.snapshot_path(root, first))
+    second = os.path.basename(snapshots.new_snapshot_dir(root))
+    assert ahead < first < second
+    assert first.startswith(ahead + "+000001-") and second.startswith(ahead + "+000002-")
+
+
+def test_writer_lock_serializes_writers(tmp_path):
+    events = []
+
+    def writer(name):
+        with snapshots.writer_lock(str(tmp_path)):
+            events.append(f"{name}-in")
+            time.sleep(0.05)
+            events.append(f"{name}-out")
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in "ab"]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert events in (["a-in", "a-out", "b-in", "b-out"], ["b-in", "b-out", "a-in", "a-out"])
+
+
+def test_writer_lock_blocks_other_processes(tmp_path):
+    held = tmp_path / "held"
+    child = subprocess.Popen([sys.executable, "-c", (
+        "import pathlib, sys, time, snapshots\n"
+        "with snapshots.writer_lock(sys.argv[1]):\n"
+        "    pathlib.Path(sys.argv[2]).touch()\n"
+        "    time.sleep(0.5)\n"
+    ), str(tmp_path), str(held)], cwd=os.path.dirname(snapshots.__file__))
+    try:
+        while not held.exists():
+            assert child.poll() is None
+            time.sleep(0.01)
+        start = time.monotonic()
+        with snapshots.writer_lock(str(tmp_path)):
+            waited = time.monotonic() - start
+        assert waited > 0.2
+    finally:
+        child.wait(5)
+
+
+def test_collect_garbage_keeps_current_leased_and_newer(tmp_path):
+    root = str(tmp_path)
+    old = _publish_new(root)
+    leased = _publish_new(root)
+    current = _publish_new(root)
+    building = os.path.basename(snapshots.new_snapshot_dir(root))
+    leases = tmp_path / snapshots.LEASES_DIR
+    leases.mkdir()
+    (leases / f"{os.getpid()}-live.json").write_text(json.dumps([leased]))
+
+    removed = snapshots.collect_garbage(root)
+
+    assert removed == [old]
+    remaining = set(os.listdir(tmp_path / snapshots.SNAPSHOTS_DIR))
+    assert remaining == {leased, current, building}
+
+
+def test_collect_garbage_ignores_leases_of_dead_processes(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    old = _publish_new(root)
+    _publish_new(root)
+    leases = tmp_path / snapshots.LEASES_DIR
+    leases.mkdir()
+    lease = leases / "999999-dead.json"
+    lease.write_text(json.dumps([old]))
+    monkeypatch.setattr(snapshots, "_pid_alive", lambda pid: pid != 999999)
+
+    assert snapshots.collect_garbage(root) == [old]
+    assert not lease.exists()
+
+
+def test_in_flight_request_keeps_old_snapshot_until_released(tmp_path):
+    root = str(tmp_path)
+    first = _publish_new(root)
+    closed = []
+    handle = snapshots.IndexHandle(root, lambda path: os.path.basename(path), closed.append)
+
+    version, store = handle.acquire()
+    second = _publish_new(root)
+    assert handle.refresh(force=True)
+
+    # The old version is still leased by the in-flight request
+    assert snapshots.collect_garbage(root) == []
+    assert os.path.isdir(snapshots.snapshot_path(root, first))
+    assert closed == []
+
+    handle.release(version)
+    assert closed == [first]
+    assert handle.acquire()[0] == second
+    # release() collects the old snapshot in the background
+    deadline = time.monotonic() + 5
+    while os.path.exists(snapshots.snapshot_path(root, first)) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not os.path.exists(snapshots.snapshot_path(root, first))
+    handle.close()
+
+
+def test_swap_without_in_flight_requests_closes_immediately(tmp_path):
+    root = str(tmp_path)
+    first = _publish_new(root)
+    closed = []
+    handle = snapshots.IndexHandle(root, lambda path: os.path.basename(path), closed.append)
+    _publish_new(root)
+    assert handle.refresh(force=True)
+    assert closed == [first]
+    handle.close()
+
+
+def test_unopenable_snapshot_keeps_serving_current(tmp_path):
+    root = str(tmp_path)
+    good = _publish_new(root)
+
+    def open_store(path):
+        if os.path.basename(path).endswith("broken"):
+            raise RuntimeError("partial snapshot")
+        return os.path.basename(path)
+
+    handle = snapshots.IndexHandle(root, open_store)
+    broken = tmp_path / snapshots.SNAPSHOTS_DIR / "99999999-broken"
+    broken.mkdir()
+    snapshots.publish(root, str(broken))
+
+    assert not handle.refresh(force=True)
+    version, store = handle.acquire()
+    assert (version, store) == (good, good)
+    handle.release(version)
+    handle.close()
+
+
+def test_close_closes_current_and_retired_stores(tmp_path):
+    root = str(tmp_path)
+    first = _publish_new(root)
+    closed = []
+    handle = snapshots.IndexHandle(root, lambda path: os.path.basename(path), closed.append)
+    old_version, _ = handle.acquire()
+    second = _publish_new(root)
+    handle.refresh(force=True)
+    current_version, _ = handle.acquire()
+
+    handle.close()
+    assert closed == []  # both stores are still used by a request
+    handle.release(old_version)
+    handle.release(current_version)
+    assert sorted(closed) == sorted([first, second])
+    assert not os.listdir(tmp_path / snapshots.LEASES_DIR)
+
+
+def test_reopening_closes_the_previous_handle_store(tmp_path):
+    root = str(tmp_path)
+    version = _publish_new(root)
+    closed = []
+    for _ in range(3):
+        snapshots.IndexHandle(root, lambda path: os.path.basename(path), closed.append).close()
+    assert closed == [version] * 3
@@ -0,0 +1,68 @@
+# test_text_cache.py
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain_core")
+import text_cache  # noqa: E402
+
+
+def _parser(calls):
+    def parse(path):
+        calls.append(path)
+        return [SimpleNamespace(page_content=f"Page {i} of {path}", metadata={"source": path, "page": i})
+                for i in range(2)]
+    return parse
+
+
+def test_pages_round_trip_through_the_cache(tmp_path):
+    pdf = tmp_path / "guide.pdf"
+    pdf.write_bytes(b"%PDF-1.4 fake")
+    calls = []
+    cache_dir = str(tmp_path / "cache")
+
+    parsed = text_cache.load_pages(str(pdf), _parser(calls), cache_dir)
+    cached = text_cache.load_pages(str(pdf), _parser(calls), cache_dir)
+
+    assert calls == [str(pdf)]  # second load is served from the cache
+    assert [d.page_content for d in cached] == [d.page_content for d in parsed]
+    assert [d.metadata for d in cached] == [{"page": 0, "source": str(pdf)}, {"page": 1, "source": str(pdf)}]
+
+
+def test_moved_file_keeps_its_new_source_and_changed_file_is_reparsed(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    calls = []
+    old, new = tmp_path / "old.pdf", tmp_path / "new.pdf"
+    old.write_bytes(b"same bytes")
+    new.write_bytes(b"same bytes")
+    text_cache.load_pages(str(old), _parser(calls), cache_dir)
+    moved = text_cache.load_pages(str(new), _parser(calls), cache_dir)
+    assert calls == [str(old)]
+    assert moved[0].metadata["source"] == str(new)
+
+    new.write_bytes(b"edited bytes")
+    text_cache.load_pages(str(new), _parser(calls), cache_dir)
+    assert calls == [str(old), str(new)]
+
+
+def test_corrupt_entry_is_reparsed(tmp_path):
+    pdf = tmp_path / "guide.pdf"
+    pdf.write_bytes(b"%PDF")
+    cache_dir = tmp_path / "cache"
+    calls = []
+    text_cache.load_pages(str(pdf), _parser(calls), str(cache_dir))
+    (entry,) = cache_dir.iterdir()
+    entry.write_bytes(b"not gzip")
+    assert len(text_cache.load_pages(str(pdf), _parser(calls), str(cache_dir))) == 2
+    assert len(calls) == 2
+
+
+def test_prune_removes_other_parser_versions(tmp_path):
+    current = tmp_path / f"abc-{text_cache.PARSER_VERSION}.json.gz"
+    stale = tmp_path / "abc-00000000.json.gz"
+    other = tmp_path / "notes.txt"
+    for path in (current, stale, other):
+        path.write_bytes(b"")
+    assert text_cache.prune(str(tmp_path)) == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted([current.name, other.name])
+    assert text_cache.prune(str(tmp_path / "missing")) == 0
@@ -0,0 +1,57 @@
+# test_token_splitter.py
+import re
+
+import pytest
+
+pytest.importorskip("langchain_core")
+import token_splitter  # noqa: E402
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+class WordTokenizer:
+    """Stand-in for a fast tokenizer: one token per word or punctuation mark."""
+
+    def __call__(self, texts, add_special_tokens=False, return_offsets_mapping=False):
+        spans = [[m.span() for m in _TOKEN_RE.finditer(t)] for t in texts]
+        encoded = {"input_ids": [[0] * len(s) for s in spans]}
+        if return_offsets_mapping:
+            encoded["offset_mapping"] = spans
+        return encoded
+
+
+@pytest.fixture
+def splitter_factory(monkeypatch):
+    monkeypatch.setitem(token_splitter._tokenizers, "words", WordTokenizer())
+    return lambda chunk, overlap=0: token_splitter.TokenSentenceSplitter("words", chunk, overlap)
+
+
+def _tokens(text):
+    return len(_TOKEN_RE.findall(text))
+
+
+def test_chunks_never_exceed_token_budget(splitter_factory):
+    splitter = splitter_factory(12, 4)
+    text = " ".join(f"Sentence number {i} talks about topic {i}." for i in range(30))
+    chunks = splitter.split_text(text)
+    assert len(chunks) > 1
+    assert all(_tokens(c) <= 12 for c in chunks)
+
+
+def test_overlap_repeats_trailing_sentence(splitter_factory):
+    splitter = splitter_factory(10, 4)
+    chunks = splitter.split_text("One two three. Four five six. Seven eight nine.")
+    assert chunks[0].endswith("Four five six.")
+    assert chunks[1].startswith("Four five six.")
+
+
+def test_long_sentence_is_cut_from_original_text(splitter_factory):
+    splitter = splitter_factory(5)
+    sentence = "The WHO Criteria, 1999 (Revised) apply to Pregnancy cases here"
+    chunks = splitter.split_text(sentence)
+    assert all(_tokens(c) <= 5 for c in chunks)
+    assert " ".join(chunks) == sentence  # case, spacing and punctuation preserved
+
+
+def test_model_limit_caps_chunk_size(splitter_factory):
+    assert splitter_factory(10_000).chunk_tokens == token_splitter.MAX_MODEL_TOKENS
@@ -0,0 +1,28 @@
+# test_warmup.py
+import json
+import threading
+
+import warmup
+
+
+def test_background_warm_up_marks_ready_without_a_session(tmp_path, monkeypatch):
+    ready_file = tmp_path / "ready.json"
+    monkeypatch.setenv("RAG_WARMUP", "0")
+    monkeypatch.setenv("RAG_READY_FILE", str(ready_file))
+    monkeypatch.setattr(warmup, "_thread", None)
+    monkeypatch.setattr(warmup, "_ready", threading.Event())
+
+    thread = warmup.start_in_background()
+    assert warmup.start_in_background() is thread  # once per process
+    thread.join(5)
+
+    assert warmup.is_ready()
+    assert "pid" in json.loads(ready_file.read_text())
+
+
+def test_failed_warm_up_still_marks_ready(monkeypatch):
+    monkeypatch.delenv("RAG_READY_FILE", raising=False)
+    monkeypatch.setattr(warmup, "_ready", threading.Event())
+    monkeypatch.setattr(warmup, "collect_questions", lambda: 1 / 0)
+    warmup.warm_on_start(progress=None)
+    assert warmup.is_ready()
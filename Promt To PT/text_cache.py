@@ -0,0 +1,90 @@
+# text_cache.py
+"""
+On-disk cache of per-page PDF text, keyed by file content hash and parser version.
+
+Re-running ingest with a new chunk_size or embedding model then skips
+pypdf extraction for PDFs that have not changed. Entries are gzipped JSON.
+"""
+import gzip
+import hashlib
+import json
+import os
+import uuid
+
+from langchain_core.documents import Document
+
+# -----------------------------
+# Config
+# -----------------------------
+CACHE_DIR = os.path.join(".cache", "pdf_text")
+CACHE_FORMAT = 1  # bump when the entry layout changes
+
+
+def _parser_version() -> str:
+    """Versions that can change extracted text; part of every cache key."""
+    versions = [f"fmt{CACHE_FORMAT}"]
+    for module_name in ("pypdf", "langchain_community"):
+        try:
+            module = __import__(module_name)
+            versions.append(f"{module_name}{getattr(module, '__version__', '?')}")
+        except ImportError:
+            versions.append(f"{module_name}-missing")
+    return hashlib.sha1("-".join(versions).encode("utf-8")).hexdigest()[:8]
+
+
+PARSER_VERSION = _parser_version()
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _entry_path(content_hash: str, cache_dir: str) -> str:
+    return os.path.join(cache_dir, f"{content_hash}-{PARSER_VERSION}.json.gz")
+
+
+def load_pages(path: str, parse, cache_dir: str = CACHE_DIR) -> list:
+    """
+    Pages of the PDF at path, from the cache when possible.
+
+    Args:
+        parse: callable(path) -> list of Documents, used on a cache miss
+
+    The cached pages are returned with metadata["source"] set to path, so
+    moved or renamed files still get the right source.
+    """
+    entry = _entry_path(file_hash(path), cache_dir)
+    try:
+        with gzip.open(entry, "rt", encoding="utf-8") as f:
+            pages = json.load(f)
+        return [Document(page_content=p["text"], metadata={**p["metadata"], "source": path}) for p in pages]
+    except (FileNotFoundError, OSError, ValueError, KeyError):
+        pass
+
+    docs = parse(path)
+    pages = [
+        {"text": d.page_content, "metadata": {k: v for k, v in d.metadata.items() if k != "source"}}
+        for d in docs
+    ]
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{entry}.{uuid.uuid4().hex}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+        json.dump(pages, f, separators=(",", ":"))
+    os.replace(tmp_path, entry)
+    return docs
+
+
+def prune(cache_dir: str = CACHE_DIR) -> int:
+    """Delete entries written by other parser versions."""
+    removed = 0
+    if not os.path.isdir(cache_dir):
+        return removed
+    for name in os.listdir(cache_dir):
+        if name.endswith(".json.gz") and not name.endswith(f"-{PARSER_VERSION}.json.gz"):
+            os.remove(os.path.join(cache_dir, name))
+            removed += 1
+    return removed
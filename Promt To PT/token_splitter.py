@@ -0,0 +1,102 @@
+# token_splitter.py
+"""
+Chunking driven by the embedding model's tokenizer.
+
+Pages are split into sentences, which are packed greedily into chunks of
+at most chunk_tokens tokens, so no chunk is silently truncated by the
+embedding model. Each chunk records its token count in
+metadata["tokens"] so embedding batches can be bucketed by length.
+"""
+import re
+
+from langchain_core.documents import Document
+
+# -----------------------------
+# Config
+# -----------------------------
+MAX_MODEL_TOKENS = 510  # bge-base: 512 minus [CLS] and [SEP]
+TOKENS_KEY = "tokens"
+
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+|\n\s*\n')
+_tokenizers = {}
+
+
+def get_tokenizer(model_name: str):
+    """Load (once per process) the Hugging Face tokenizer of an embedding model."""
+    if model_name not in _tokenizers:
+        from transformers import AutoTokenizer
+        # Fast tokenizers report character offsets, used to cut long sentences
+        _tokenizers[model_name] = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+    return _tokenizers[model_name]
+
+
+class TokenSentenceSplitter:
+    def __init__(self, model_name: str, chunk_tokens: int, overlap_tokens: int = 0):
+        self.tokenizer = get_tokenizer(model_name)
+        self.chunk_tokens = min(chunk_tokens, MAX_MODEL_TOKENS)
+        self.overlap_tokens = min(overlap_tokens, self.chunk_tokens // 2)
+
+    def _count(self, texts: list) -> list:
+        if not texts:
+            return []
+        ids = self.tokenizer(texts, add_special_tokens=False)["input_ids"]
+        return [len(i) for i in ids]
+
+    def _sentences(self, text: str) -> list:
+        """
+        (sentence, tokens) pairs; sentences longer than a chunk are cut into token windows.
+
+        Windows are sliced from the original text by character offsets, since
+        decoding the (uncased) token ids would lowercase and respace it.
+        """
+        sentences = [s.strip() for s in _SENTENCE_RE.split(text) if s and s.strip()]
+        if not sentences:
+            return []
+        pieces = []
+        encoded = self.tokenizer(sentences, add_special_tokens=False, return_offsets_mapping=True)
+        for sentence, ids, offsets in zip(sentences, encoded["input_ids"], encoded["offset_mapping"]):
+            if len(ids) <= self.chunk_tokens:
+                pieces.append((sentence, len(ids)))
+                continue
+            for start in range(0, len(ids), self.chunk_tokens):
+                window = offsets[start:start + self.chunk_tokens]
+                pieces.append((sentence[window[0][0]:window[-1][1]].strip(), len(window)))
+        return pieces
+
+    def split_text(self, text: str) -> list:
+        """Pack sentences into chunk texts of at most chunk_tokens tokens."""
+        chunks = []
+        current, current_tokens = [], 0
+        for sentence, tokens in self._sentences(text):
+            # +1 approximates the space joining two sentences
+            if current and current_tokens + tokens + 1 > self.chunk_tokens:
+                chunks.append(" ".join(s for s, _ in current))
+                # Carry trailing sentences over as overlap
+                overlap, overlap_tokens = [], 0
+                for s, t in reversed(current):
+                    if overlap_tokens + t > self.overlap_tokens:
+                        break
+                    overlap.insert(0, (s, t))
+                    overlap_tokens += t
+                current, current_tokens = overlap, overlap_tokens
+                if current_tokens + tokens + 1 > self.chunk_tokens:
+                    current, current_tokens = [], 0
+            current.append((sentence, tokens))
+            current_tokens += tokens + (1 if len(current) > 1 else 0)
+        if current:
+            chunks.append(" ".join(s for s, _ in current))
+        return chunks
+
+    def split_documents(self, docs) -> list:
+        """Split pages into chunks carrying the page metadata plus their exact token count."""
+        chunks = []
+        for doc in docs:
+            texts = self.split_text(doc.page_content)
+            for text, tokens in zip(texts, self._count(texts)):
+                chunks.append(Document(page_content=text, metadata={**doc.metadata, TOKENS_KEY: tokens}))
+        return chunks
+
+
+def by_length(chunks) -> list:
+    """Chunks ordered by token count, so each embedding batch pads to a similar length."""
+    return sorted(chunks, key=lambda c: c.metadata.get(TOKENS_KEY, len(c.page_content)))
@@ -0,0 +1,167 @@
+# warmup.py
+"""
+Cache pre-warming for a freshly started process.
+
+Replays a curated FAQ list plus the most frequent questions from the query
+log (history.py) through the pipeline: all of them are embedded in batches
+to fill the query-embedding cache, then answered one by one to fill the
+answer cache and page the index in. Stops when the time budget runs out.
+
+Caches live in the process that fills them, so warm-up has to run inside
+the serving process. start_in_background() runs warm_on_start() in a daemon
+thread; run_app.py calls it when the server process starts, before any
+browser connects, and app.py calls it too in case the app was started with
+plain `streamlit run app.py` (then warm-up only begins with the first
+session). RAG_WARMUP=0 disables it, RAG_WARMUP_BUDGET sets the budget in
+seconds. If RAG_READY_FILE is set, that file is created once warm-up is
+done, for use as a readiness probe.
+
+The command line does not warm any server; it only measures how long
+warm-up takes with a given question set and budget:
+
+    python warmup.py --budget 60 --top 200
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+import history
+
+# -----------------------------
+# Config
+# -----------------------------
+FAQ_FILE = "warmup_questions.txt"
+BUDGET_SECONDS = 30.0
+TOP_QUESTIONS = 100   # most frequent logged questions to replay
+HISTORY_DAYS = 30     # only count questions asked this recently
+EMBED_BATCH = 32
+
+_ready = threading.Event()
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def load_faq(path: str = FAQ_FILE) -> list:
+    """Questions from a text file, one per line ('#' starts a comment)."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    except FileNotFoundError:
+        return []
+
+
+def collect_questions(faq_path: str = FAQ_FILE, top: int = TOP_QUESTIONS, days: float = HISTORY_DAYS) -> list:
+    """FAQ questions first, then logged questions by frequency, without near-duplicates."""
+    questions = load_faq(faq_path) + [q for q, _ in history.top_questions(top, days)]
+    seen, unique = set(), []
+    for question in questions:
+        key = history.question_key(question)
+        if key not in seen:
+            seen.add(key)
+            unique.append(question)
+    return unique
+
+
+def warm(questions, budget: float = BUDGET_SECONDS, progress=None) -> dict:
+    """
+    Fill the query-embedding and answer caches with questions within budget seconds.
+
+    Args:
+        progress: optional callable(stage, done, total) called after each step
+    """
+    import rag_pipeline
+
+    start = time.monotonic()
+    deadline = start + budget
+    stats = {"questions": len(questions), "embedded": 0, "replayed": 0, "errors": 0}
+
+    for i in range(0, len(questions), EMBED_BATCH):
+        if time.monotonic() >= deadline:
+            break
+        batch = questions[i:i + EMBED_BATCH]
+        rag_pipeline.embedding.prefill(batch)
+        stats["embedded"] += len(batch)
+        if progress:
+            progress("embed", stats["embedded"], len(questions))
+
+    for question in questions:
+        if time.monotonic() >= deadline:
+            break
+        try:
+            rag_pipeline.ask_question(question)
+        except Exception:
+            stats["errors"] += 1
+        stats["replayed"] += 1
+        if progress:
+            progress("answer", stats["replayed"], len(questions))
+
+    stats["seconds"] = round(time.monotonic() - start, 3)
+    stats["budget_exhausted"] = stats["replayed"] < len(questions)
+    return stats
+
+
+def print_progress(stage: str, done: int, total: int):
+    if done == total or done % 10 == 0:
+        print(f"Warm-up {stage}: {done}/{total}")
+
+
+def mark_ready():
+    _ready.set()
+    ready_file = os.getenv("RAG_READY_FILE")
+    if ready_file:
+        with open(ready_file, "w", encoding="utf-8") as f:
+            json.dump({"pid": os.getpid(), "ready_at": time.time()}, f)
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def warm_on_start(progress=print_progress):
+    """Warm up with the settings from the environment, then mark the process ready."""
+    ready_file = os.getenv("RAG_READY_FILE")
+    if ready_file and os.path.exists(ready_file):
+        os.remove(ready_file)  # left by a previous process
+    stats = None
+    try:
+        if os.getenv("RAG_WARMUP", "1").lower() not in ("0", "false", "no"):
+            budget = float(os.getenv("RAG_WARMUP_BUDGET", BUDGET_SECONDS))
+            stats = warm(collect_questions(), budget, progress)
+            print(f"Warm-up: replayed {stats['replayed']}/{stats['questions']} questions in {stats['seconds']}s")
+    except Exception as e:
+        # A cold cache is slower, not broken: serve anyway
+        print(f"Warm-up failed, serving with cold caches: {e}")
+    mark_ready()
+    return stats
+
+
+def start_in_background(progress=print_progress) -> threading.Thread:
+    """Start warm_on_start() in a daemon thread, once per process. Returns immediately."""
+    global _thread
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=warm_on_start, args=(progress,), name="rag-warmup", daemon=True)
+            _thread.start()
+    return _thread
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure warm-up time (the caches filled here die with this process; "
+                    "python run_app.py warms the app when it starts)")
+    parser.add_argument("--faq", default=FAQ_FILE)
+    parser.add_argument("--top", type=int, default=TOP_QUESTIONS, help="Most frequent logged questions to replay")
+    parser.add_argument("--days", type=float, default=HISTORY_DAYS)
+    parser.add_argument("--budget", type=float, default=BUDGET_SECONDS, help="Seconds to spend at most")
+    args = parser.parse_args()
+
+    questions = collect_questions(args.faq, args.top, args.days)
+    print(f"Timing warm-up of {len(questions)} questions (budget {args.budget:g}s); no server is warmed...")
+    stats = warm(questions, args.budget, print_progress)
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()